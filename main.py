@@ -5,7 +5,6 @@ import sys
 
 sys.path.append("scripts/libs")
 from configdeode import ConfigDeode
-from LoadWriteData import LoadConfigFileFromYaml
 
 
 def main():
@@ -59,6 +58,10 @@ def main():
             "Only plot_regrid and verification tasks are affected."
         )
     )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes used by regrid.py and link_obs.py (default: 1)"
+    )
 
     args = parser.parse_args()
 
@@ -87,59 +90,56 @@ def main():
         exp = args.exp
         case = args.case
 
-    # get accumulation period and frequency of verification
-    obs = args.obs
-    obs_db, var_verif = obs.split('_')
-    config_obs_db = LoadConfigFileFromYaml(
-        f"config/obs_db/config_{obs_db}.yaml"
-    )
-    accum_h = config_obs_db["vars"][var_verif]["verif"]["times"]["accum_hours"]
-    freq_verif = config_obs_db["vars"][var_verif]["verif"]["times"]["freq_verif"]
+    # several obs can be given separated by commas
+    obs_list = args.obs.split(',')
 
     if args.replace_outputs:
         replace = "True"
     else:
         replace = "False"
 
-    subprocess.run([
-        "python3", "scripts/verification/set_environment.py",
-        obs, case, exp, args.relative_indexed_path
-    ])
-
-    if args.link_obs:
+    for obs in obs_list:
         subprocess.run([
-            "python3", "scripts/verification/link_obs.py",
-            obs, case, args.relative_indexed_path
+            "python3", "scripts/verification/set_environment.py",
+            obs, case, exp, args.relative_indexed_path
         ])
+
+        if args.link_obs:
+            subprocess.run([
+                "python3", "scripts/verification/link_obs.py",
+                obs, case, args.relative_indexed_path, str(args.workers)
+            ])
+    # the exp fields are decoded only once for all the obs
     if args.run_regrid:
         subprocess.run([
             "python3", "scripts/verification/regrid.py",
-            obs, case, exp, args.relative_indexed_path
-        ])
-    if args.run_plot_regrid:
-        subprocess.run([
-            "python3", "scripts/utils/plot_regrid.py",
-            obs, case, exp, args.relative_indexed_path, replace
-        ])
-    if args.run_verif:
-        subprocess.run([
-            "python3", "scripts/verification/verification.py",
-            obs, case, exp, args.relative_indexed_path, replace
-        ])
-    if args.run_panels:
-        subprocess.run([
-            "python3", "scripts/utils/create_panels.py",
-            obs, case, exp, args.relative_indexed_path
-        ])
-    if args.run_comparison and args.exp_ref:
-        subprocess.run([
-            'python3', 'scripts/verification/compExps_metrics.py',
-            obs, case, f"{args.exp_ref}-VS-{exp}", args.relative_indexed_path
-        ])
-        subprocess.run([
-            'python3', 'scripts/verification/compExps_maps.py',
-            obs, case, f"{args.exp_ref}-VS-{exp}", args.relative_indexed_path
+            args.obs, case, exp, args.relative_indexed_path, str(args.workers)
         ])
+    for obs in obs_list:
+        if args.run_plot_regrid:
+            subprocess.run([
+                "python3", "scripts/utils/plot_regrid.py",
+                obs, case, exp, args.relative_indexed_path, replace
+            ])
+        if args.run_verif:
+            subprocess.run([
+                "python3", "scripts/verification/verification.py",
+                obs, case, exp, args.relative_indexed_path, replace
+            ])
+        if args.run_panels:
+            subprocess.run([
+                "python3", "scripts/utils/create_panels.py",
+                obs, case, exp, args.relative_indexed_path
+            ])
+        if args.run_comparison and args.exp_ref:
+            subprocess.run([
+                'python3', 'scripts/verification/compExps_metrics.py',
+                obs, case, f"{args.exp_ref}-VS-{exp}", args.relative_indexed_path
+            ])
+            subprocess.run([
+                'python3', 'scripts/verification/compExps_maps.py',
+                obs, case, f"{args.exp_ref}-VS-{exp}", args.relative_indexed_path
+            ])
 
 
 if __name__ == '__main__':
@@ -1,10 +1,20 @@
+import os
 import yaml
 import numpy as np
 import pygrib
 import h5py
 import xarray as xr
+import netCDF4
 import pyproj
 import pickle
+import threading
+import hashlib
+from collections import OrderedDict, Counter
+
+from gribindex import load_grib_index, find_entry, read_msg
+from fieldstore import get_field_store, fill_masked
+from runtime import get_working_dtype, get_runtime_settings
+from gridcache import get_cached_grid, get_grib_grid_definition, get_HDF5_grid_definition, get_nc_grid_definition
 
 def LoadConfigFileFromYaml(yamlFile):
     with open(yamlFile, 'r') as stream:
@@ -19,29 +29,179 @@ def check_is_typelist(var):
     else:
         raise TypeError(f'wrong var dtype: {type(var)}')
 
-def get_vars_from_nc(file_nc, vars, date = None):
+class Field(object):
+    # values of the variables read from a file with a single open, and the
+    # lat-lon grid of the file, which is only computed when it is requested
+    # (once per geometry, see gridcache). The grid arrays are read-only. If
+    # only a window of the file was read, the grid is cropped to it
+    def __init__(self, values, grid_function, window = None):
+        self.values = values
+        self._grid_function = grid_function
+        self._window = window
+        self._grid = None
+
+    @property
+    def data(self):
+        if len(self.values) == 1:
+            return self.values[0]
+        return self.values
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            lat, lon = self._grid_function()
+            if self._window is not None:
+                idLatIni, idLatEnd, idLonIni, idLonEnd = self._window
+                lat = lat[idLatIni:idLatEnd, idLonIni:idLonEnd]
+                lon = lon[idLatIni:idLatEnd, idLonIni:idLonEnd]
+            self._grid = (lat, lon)
+        return self._grid
+
+    @property
+    def lat(self):
+        return self.grid[0]
+
+    @property
+    def lon(self):
+        return self.grid[1]
+
+def split_grid_vars(vars):
+    # 'lat' and 'lon' are taken from the grid of the field
     list_vars = check_is_typelist(vars)
-    print(f'INFO:LoadWriteData:reading {file_nc}')
-    with xr.open_dataset(file_nc) as nc_dataset:
-        if date is None:
-            date_get = nc_dataset.time.values[0]
-        else:
-            date_get = date
-        listArrays = []
-        for var in list_vars:
-            print(f'INFO:LoadWriteData:get {var} values')
-            if ((var == 'lat') | (var == 'lon')):
-                listArrays.append(nc_dataset[var].values.copy())
-            else:
-                listArrays.append(nc_dataset[var].sel(time=date_get).values.copy())
-        if len(list_vars) == 1:
-            return listArrays[0]
+    return list_vars, [var for var in list_vars if not ((var == 'lat') | (var == 'lon'))]
+
+def get_values_from_field(field, list_vars):
+    values = iter(field.values)
+    list_values = []
+    for var in list_vars:
+        if var == 'lat':
+            list_values.append(field.lat)
+        elif var == 'lon':
+            list_values.append(field.lon)
         else:
-            return listArrays
+            list_values.append(next(values))
+    if len(list_values) == 1:
+        return list_values[0]
+    else:
+        return list_values
+
+class DatasetPool(object):
+    # netCDF files kept open (xarray datasets) to be read several times
+    # without parsing their metadata again. The least recently used dataset
+    # is closed when more than max_open are open, and a dataset is reopened
+    # if its file has been rewritten. Shared by the threads of the process
+    def __init__(self, max_open = 32):
+        self.max_open = max_open
+        self.datasets = OrderedDict()
+        self.lock = threading.RLock()
+
+    def get(self, file_nc):
+        stat = os.stat(file_nc)
+        file_id = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        with self.lock:
+            if file_nc in self.datasets:
+                saved_id, nc_dataset = self.datasets[file_nc]
+                if saved_id == file_id:
+                    self.datasets.move_to_end(file_nc)
+                    return nc_dataset
+                self.close(file_nc)
+            nc_dataset = xr.open_dataset(file_nc)
+            self.datasets[file_nc] = (file_id, nc_dataset)
+            while len(self.datasets) > self.max_open:
+                self.close(next(iter(self.datasets)))
+            return nc_dataset
+
+    def close(self, file_nc):
+        with self.lock:
+            entry = self.datasets.pop(file_nc, None)
+            if entry is not None:
+                entry[1].close()
+
+    def close_all(self):
+        # must be called before forking processes that read netCDF files
+        with self.lock:
+            while len(self.datasets) > 0:
+                self.close(next(iter(self.datasets)))
+
+nc_pool = DatasetPool(get_runtime_settings()['max_open_nc'])
+
+class TimeSeriesNC(object):
+    # several netCDF files (e.g. the obs or regridded files of an init) seen
+    # as a single time series. files: {date: file expected to hold it}. A
+    # file is only opened (in the pool) to index its time steps when one of
+    # its dates is first requested, and a file expected to hold a single
+    # date (e.g. a regridded file per lead time) is only checked to exist
+    def __init__(self, files):
+        self.files = {np.datetime64(date, 'ns'): file_nc for date, file_nc in files.items()}
+        self.n_dates = Counter(self.files.values())
+        self.dates_in_file = {}
+        # dates requested from several threads (Prefetcher)
+        self.lock = threading.Lock()
+
+    def get_file(self, date):
+        # None if date is not found
+        date = np.datetime64(date, 'ns')
+        file_nc = self.files.get(date)
+        if file_nc is None or not os.path.isfile(file_nc):
+            return None
+        if self.n_dates[file_nc] == 1:
+            return file_nc
+        with self.lock:
+            if file_nc not in self.dates_in_file:
+                self.dates_in_file[file_nc] = set(
+                    np.datetime64(date_nc, 'ns') for date_nc in nc_pool.get(file_nc).time.values
+                )
+        if date not in self.dates_in_file[file_nc]:
+            return None
+        return file_nc
+
+    def __contains__(self, date):
+        return self.get_file(date) is not None
+
+    def read_field(self, vars, date, window = None):
+        return read_field(self.get_file(date), 'netCDF', vars, date, window)
+
+def get_nc_grid_dataset(file_nc, nc_dataset):
+    # (filename, dataset) holding the lat-lon of file_nc: files written with
+    # the archive profile have them in a grid file of the same folder
+    if 'lat' in nc_dataset.variables or 'grid_file' not in nc_dataset.attrs:
+        return file_nc, nc_dataset
+    file_grid = os.path.join(os.path.dirname(file_nc), nc_dataset.attrs['grid_file'])
+    return file_grid, nc_pool.get(file_grid)
+
+def read_field_from_nc(file_nc, vars = [], date = None, window = None):
+    list_vars = check_is_typelist(vars)
+    print(f'INFO:LoadWriteData:reading {file_nc}')
+    nc_dataset = nc_pool.get(file_nc)
+    if date is None:
+        date_get = nc_dataset.time.values[0]
+    else:
+        date_get = date
+    listArrays = []
+    for var in list_vars:
+        print(f'INFO:LoadWriteData:get {var} values')
+        # time steps along the first dimension ('time' unless several time
+        # series are held, e.g. obs cubes)
+        values = nc_dataset[var]
+        values = values.sel({values.dims[0]: date_get})
+        if window is not None:
+            idLatIni, idLatEnd, idLonIni, idLonEnd = window
+            values = values[idLatIni:idLatEnd, idLonIni:idLonEnd]
+        listArrays.append(values.values.astype(get_working_dtype(), copy=False))
+    file_grid, grid_dataset = get_nc_grid_dataset(file_nc, nc_dataset)
+    grid = get_cached_grid(
+        get_nc_grid_definition(file_grid, grid_dataset),
+        lambda: (grid_dataset['lat'].values, grid_dataset['lon'].values)
+    )
+    return Field(listArrays, lambda: grid, window)
+
+def get_vars_from_nc(file_nc, vars, date = None):
+    list_vars, data_vars = split_grid_vars(vars)
+    return get_values_from_field(read_field_from_nc(file_nc, data_vars, date), list_vars)
 
 def get_lat_lon_from_nc(file_nc):
-    lat, lon = get_vars_from_nc(file_nc, vars = ['lat', 'lon'])
-    return lat.copy(), lon.copy()
+    field = read_field_from_nc(file_nc)
+    return field.lat, field.lon
         
 def get_lat_lon_raw_from_msg(msg):
     try:
@@ -51,7 +211,7 @@ def get_lat_lon_raw_from_msg(msg):
         n_y = msg.Ny
         lat = msg.latitudes.reshape((n_y, n_x))
         lon = msg.longitudes.reshape((n_y, n_x))
-    return lat.copy(), lon.copy()
+    return lat, lon
 
 def get_msg_from_code(grib_obj, code):
     if isinstance(code, int):
@@ -68,47 +228,110 @@ def get_msg_from_code(grib_obj, code):
         raise TypeError(f'wrong var dtype: {type(code)}')
     return grb
 
-def get_vars_from_grib(file_grib, vars):
-    list_vars = check_is_typelist(vars)
-    grbs = pygrib.open(file_grib)
-    print(f'INFO:LoadWriteData:reading {file_grib}')
-    first_grb = grbs.select()[0]
-    lat_raw, lon_raw = get_lat_lon_raw_from_msg(first_grb)
-    if lat_raw[0, 0] > lat_raw[-1, 0]:
-        lat_must_flip = True
+def get_lat_lon_from_msg(msg, lat_must_flip):
+    print(f'INFO:LoadWriteData:get lat-lon grid')
+    lat_raw, lon_raw = get_lat_lon_raw_from_msg(msg)
+    if lat_must_flip:
         lat = np.flipud(lat_raw)
     else:
-        lat_must_flip = False
-        lat = lat_raw.copy()
+        lat = lat_raw
+    lon = np.where(lon_raw > 180., lon_raw - 360., lon_raw)
+    return lat, lon
+
+def read_field_from_grib(file_grib, vars = [], window = None):
+    # messages are located through the sidecar index of the file: only the
+    # requested messages are decoded (pygrib select as fallback)
+    list_vars = check_is_typelist(vars)
+    print(f'INFO:LoadWriteData:reading {file_grib}')
+    entries = load_grib_index(file_grib)
+    grbs = None
     values_to_get = []
-    for var in list_vars:
-        if var == 'lat':
-            print(f'INFO:LoadWriteData:get latitude grid')
-            values_to_get.append(lat)
-        elif var == 'lon':
-            print(f'INFO:LoadWriteData:get longitude grid')
-            values_to_get.append(np.where(lon_raw > 180., lon_raw - 360., lon_raw))
+    with open(file_grib, 'rb') as stream:
+        first_grb = read_msg(file_grib, entries[0], stream)
+        j_scans = entries[0]['jScansPositively']
+        if j_scans is None:
+            lat_raw = get_lat_lon_raw_from_msg(first_grb)[0]
+            lat_must_flip = bool(lat_raw[0, 0] > lat_raw[-1, 0])
         else:
-            grb = get_msg_from_code(grbs, var)
+            lat_must_flip = (j_scans == 0)
+        for var in list_vars:
+            entry = find_entry(entries, var)
+            if entry is not None:
+                grb = read_msg(file_grib, entry, stream)
+            else:
+                if grbs is None:
+                    grbs = pygrib.open(file_grib)
+                grb = get_msg_from_code(grbs, var)
             try:
                 print(f'INFO:LoadWriteData:get {grb.name} values in {grb.units} at {grb.level} ({grb.typeOfLevel})')
             except RuntimeError:
                 print('INFO:LoadWriteData:get values')
             if lat_must_flip:
-                values_to_get.append(np.flipud(grb["values"]))
+                values = np.flipud(grb["values"])
             else:
-                values_to_get.append(grb["values"])
-    grbs.close()
-    if len(list_vars) == 1:
-        return values_to_get[0]
-    else:
-        return values_to_get
+                values = grb["values"]
+            if window is not None:
+                idLatIni, idLatEnd, idLonIni, idLonEnd = window
+                values = values[idLatIni:idLatEnd, idLonIni:idLonEnd].copy()
+            values_to_get.append(values.astype(get_working_dtype(), copy=False))
+    if grbs is not None:
+        grbs.close()
+    return Field(
+        values_to_get,
+        lambda: get_cached_grid(
+            get_grib_grid_definition(first_grb, lat_must_flip),
+            lambda: get_lat_lon_from_msg(first_grb, lat_must_flip)
+        ),
+        window
+    )
+
+def get_vars_from_grib(file_grib, vars):
+    list_vars, data_vars = split_grid_vars(vars)
+    return get_values_from_field(read_field_from_grib(file_grib, data_vars), list_vars)
 
 def get_lat_lon_from_grib(file_grib):
-    lat, lon = get_vars_from_grib(file_grib, vars = ['lat', 'lon'])
-    return lat.copy(), lon.copy()
+    field = read_field_from_grib(file_grib)
+    return field.lat, field.lon
 
-def get_vars_from_HDF5(filename, vars):
+def get_projection_from_grib(file_grib):
+    # proj4 string of the native grid of the first message (None if unknown)
+    grbs = pygrib.open(file_grib)
+    grb = grbs.message(1)
+    try:
+        projparams = dict(grb.projparams)
+    except (AttributeError, RuntimeError, ValueError):
+        projparams = None
+    grbs.close()
+    if projparams is None:
+        return None
+    if projparams.get('proj') == 'cyl':
+        projparams['proj'] = 'longlat'
+    return ' '.join([f'+{k}={v}' for k, v in projparams.items()])
+
+def get_lat_lon_from_HDF5_attrs(where_attrs):
+    # get projection params
+    projection = pyproj.Proj(where_attrs['projdef'].decode())
+    ll_lat = where_attrs['LL_lat']
+    ll_lon = where_attrs['LL_lon']
+    ur_lat = where_attrs['UR_lat']
+    ur_lon = where_attrs['UR_lon']
+    res_x = where_attrs['xsize']
+    res_y = where_attrs['ysize']
+    # transform lat-lon coordinates to meters
+    ll_x, ll_y = projection(ll_lon, ll_lat)
+    ur_x, ur_y = projection(ur_lon, ur_lat)
+    # build grid in meters
+    xi = np.linspace(int(np.round(ll_x, 0)), int(np.round(ur_x, 0)), res_x)
+    yi = np.linspace(int(np.round(ll_y, 0)), int(np.round(ur_y, 0)), res_y)
+    x, y = np.meshgrid(xi, yi)
+    # reproject to lat-lon coordinates
+    print(f'INFO:get lat-lon coordinates')
+    lon2D, lat2D = projection(x, y, inverse=True)
+    return lat2D, lon2D
+
+def read_field_from_HDF5(filename, vars = [], window = None):
+    # only the window of the datasets is read (hyperslab of the file), and
+    # nodata (-9999000) and undetect (-8888000) values are masked in place
     list_vars = check_is_typelist(vars)
     hf = h5py.File(filename, 'r')
     print(f'INFO:reading {filename}')
@@ -119,61 +342,360 @@ def get_vars_from_HDF5(filename, vars):
         for group in groups[1:]:
             grp = grp.get(group)
         print(f'INFO:get {var} values')
-        values_raw = grp.get(var)[:].copy()
-        values_flip = np.flip(
-            np.where(values_raw == -8888000., 0.0, values_raw),
-            axis=0
+        dataset = grp.get(var)
+        n_y, n_x = dataset.shape
+        if window is None:
+            idLatIni, idLatEnd, idLonIni, idLonEnd = 0, n_y, 0, n_x
+        else:
+            idLatIni, idLatEnd, idLonIni, idLonEnd = window
+        # rows are stored from north to south: the window refers to the
+        # flipped grid
+        values = np.empty(
+            (idLatEnd - idLatIni, idLonEnd - idLonIni), dtype=get_working_dtype()
         )
-        values = np.where(values_flip == -9999000., np.nan, values_flip)
+        dataset.read_direct(
+            values,
+            source_sel=np.s_[n_y - idLatEnd:n_y - idLatIni, idLonIni:idLonEnd]
+        )
+        values = np.flipud(values)
+        values[values == -8888000.] = 0.0
+        values[values == -9999000.] = np.nan
         list_values.append(values)
+    where = hf.get('where')
+    where_attrs = dict(where.attrs) if where is not None else None
     hf.close()
-    if len(list_values) == 1:
-        return list_values[0]
-    else:
-        return list_values
+    return Field(
+        list_values,
+        lambda: get_cached_grid(
+            get_HDF5_grid_definition(where_attrs),
+            lambda: get_lat_lon_from_HDF5_attrs(where_attrs)
+        ),
+        window
+    )
+
+def get_vars_from_HDF5(filename, vars):
+    return read_field_from_HDF5(filename, vars).data
 
 def get_lat_lon_from_HDF5(filename):
-    hf = h5py.File(filename, 'r')
-    print(f'INFO:reading {filename}')
-    # get projection params
-    where = hf.get('where')
-    projection = pyproj.Proj(where.attrs.get('projdef').decode())
-    ll_lat = where.attrs.get('LL_lat')
-    ll_lon = where.attrs.get('LL_lon')
-    ur_lat = where.attrs.get('UR_lat')
-    ur_lon = where.attrs.get('UR_lon')
-    res_x = where.attrs.get('xsize')
-    res_y = where.attrs.get('ysize')
-    hf.close()
-    # transform lat-lon coordinates to meters
-    ll_x, ll_y = projection(ll_lon, ll_lat)
-    ur_x, ur_y = projection(ur_lon, ur_lat)
-    # build grid in meters
-    xi = np.linspace(int(np.round(ll_x, 0)), int(np.round(ur_x, 0)), res_x)
-    yi = np.linspace(int(np.round(ll_y, 0)), int(np.round(ur_y, 0)), res_y)
-    x, y = np.meshgrid(xi, yi)
-    # reproject to lat-lon coordinates
-    print(f'INFO:get lat-lon coordinates')
-    lon2D, lat2D = projection(x, y, inverse=True)
-    return lat2D.copy(), lon2D.copy()
+    field = read_field_from_HDF5(filename)
+    return field.lat, field.lon
+
+def read_field(filename, fileformat, vars = [], date = None, window = None):
+    # data (field.data) and lat-lon grid (field.lat, field.lon) of a file
+    # opened only once. date is only used for netCDF files. window: indices
+    # (domains.get_crop_indices) of the part of the grid to read. Fields
+    # already decoded are read from the field store (memory maps)
+    list_vars = check_is_typelist(vars)
+    store = get_field_store()
+    if (store is None) | (len(list_vars) == 0):
+        return read_field_from_file(filename, fileformat, list_vars, date, window)
+    keys = [store.get_key(filename, fileformat, var, date, window) for var in list_vars]
+    values = [store.load(key) for key in keys]
+    if all(value is not None for value in values):
+        print(f'INFO:LoadWriteData:{filename} values read from field store')
+        return Field(
+            values,
+            lambda: read_field_from_file(filename, fileformat, [], date, window).grid
+        )
+    field = read_field_from_file(filename, fileformat, list_vars, date, window)
+    field.values = [fill_masked(value) for value in field.values]
+    for key, value in zip(keys, field.values):
+        store.save(key, value)
+    return field
+
+def read_field_from_file(filename, fileformat, vars = [], date = None, window = None):
+    if fileformat == 'Grib':
+        return read_field_from_grib(filename, vars, window)
+    elif fileformat == 'netCDF':
+        return read_field_from_nc(filename, vars, date, window)
+    elif fileformat == 'HDF5':
+        return read_field_from_HDF5(filename, vars, window)
+    else:
+        raise ValueError(f'unknown file format: {fileformat}')
 
 def build_dataset(values, date, lat, lon, var_name, attrs_var = {}, attrs_nc = {}):
-    attrs_var.update({'coordinates': 'time lat lon'})
-    attrs_nc.update({'history': 'file created for spatial verification purposes'})
+    # date can be a list of dates (values with shape (time, y, x)). Values are
+    # saved in the working dtype (no copy if they are already in it)
+    values = np.asarray(values).astype(get_working_dtype(), copy=False)
+    attrs_var = dict(attrs_var, coordinates='time lat lon')
+    attrs_nc = dict(attrs_nc, history='file created for spatial verification purposes')
+    if isinstance(date, list):
+        dates = date
+    else:
+        dates = [date]
     ds = xr.Dataset(
         {var_name: xr.DataArray(
-            values.reshape(1, values.shape[0], values.shape[1]), 
+            values.reshape(len(dates), values.shape[-2], values.shape[-1]), 
             dims = ['time', 'y', 'x'], 
             attrs = attrs_var
         )}, 
         coords = {
-            'time': [date], 
+            'time': dates, 
             'lat': (('y', 'x'), lat, {"units": "degrees_north"}), 
             'lon': (('y', 'x'), lon, {"units": "degrees_north"}), 
         },
         attrs = attrs_nc
     )
-    return ds.copy()
+    return ds
+
+# encodings of the netCDF files written (nc_profile in
+# config/config_runtime.yaml):
+#   fast: uncompressed, values in the working dtype
+#   default: zlib-compressed, values in the working dtype
+#   archive: zlib-compressed, values packed as int16 (scale and offset from
+#            the range of each variable) and lat-lon saved once per folder in
+#            a grid file referenced by the data files
+NC_PROFILES = {
+    'fast': {'zlib': False, 'complevel': 0, 'pack': False, 'dedup_coords': False},
+    'default': {'zlib': True, 'complevel': 4, 'pack': False, 'dedup_coords': False},
+    'archive': {'zlib': True, 'complevel': 6, 'pack': True, 'dedup_coords': True}
+}
+PACK_MAX = 32766
+PACK_FILL_VALUE = np.int16(-32767)
+
+def get_nc_profile(profile = None):
+    if profile is None:
+        profile = get_runtime_settings()['nc_profile']
+    try:
+        return NC_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f'unknown netCDF profile: {profile}')
+
+def get_packing_encoding(values):
+    # int16 scale and offset covering the range of values (NaN are saved as
+    # the fill value)
+    valid = values[np.isfinite(values)]
+    if valid.size == 0:
+        return get_packing_encoding_from_range(0., 0.)
+    return get_packing_encoding_from_range(float(valid.min()), float(valid.max()))
+
+def get_packing_encoding_from_range(value_min, value_max):
+    return {
+        'dtype': 'int16',
+        'scale_factor': (value_max - value_min) / (2 * PACK_MAX) or 1.,
+        'add_offset': (value_max + value_min) / 2.,
+        '_FillValue': PACK_FILL_VALUE
+    }
+
+def get_nc_encoding(ds, profile):
+    encoding = {}
+    for var in ds.variables:
+        if np.issubdtype(ds[var].dtype, np.datetime64):
+            encoding[var] = {'units': 'seconds since 1970-01-01'}
+            continue
+        if var in ds.data_vars and profile['pack']:
+            encoding[var] = get_packing_encoding(ds[var].values)
+        elif var in ds.data_vars:
+            encoding[var] = {'dtype': str(get_working_dtype())}
+        else:
+            encoding[var] = {}
+        if profile['zlib']:
+            encoding[var].update(
+                zlib=True, complevel=profile['complevel'], shuffle=True,
+                # a time step per chunk
+                chunksizes=tuple(
+                    1 if dim.startswith('time') else size
+                    for dim, size in zip(ds[var].dims, ds[var].shape)
+                )
+            )
+    return encoding
+
+def write_grid_file(ds, folder, profile):
+    # lat-lon of the dataset in a grid file shared by the files of the folder
+    # (written only if not found). Returns its name
+    lat = np.ascontiguousarray(ds['lat'].values)
+    lon = np.ascontiguousarray(ds['lon'].values)
+    sha = hashlib.sha1(lat.tobytes() + lon.tobytes()).hexdigest()
+    file_grid = f'grid_{sha[:16]}.nc'
+    filename = os.path.join(folder, file_grid)
+    if not os.path.isfile(filename):
+        ds_grid = xr.Dataset(coords={'lat': ds['lat'].variable, 'lon': ds['lon'].variable})
+        encoding = {}
+        if profile['zlib']:
+            encoding = {
+                var: {'zlib': True, 'complevel': profile['complevel'], 'shuffle': True}
+                for var in ('lat', 'lon')
+            }
+        file_tmp = f'{filename}.{os.getpid()}_{threading.get_ident()}.tmp'
+        ds_grid.to_netcdf(file_tmp, encoding=encoding)
+        os.replace(file_tmp, filename)
+        print(f'INFO:LoadWriteData:grid saved in {filename}')
+    return file_grid
+
+def write_dataset(ds, filename, profile = None, unlimited_dims = None):
+    # all the netCDF files are written here, with the encoding of the
+    # profile (default: nc_profile of the runtime config)
+    profile = get_nc_profile(profile)
+    # encodings of datasets read from files are not reused
+    ds = ds.copy(deep=False)
+    for var in ds.variables:
+        ds.variables[var].encoding = {}
+    ds.attrs.pop('grid_file', None)
+    if profile['dedup_coords'] and 'lat' in ds.variables:
+        file_grid = write_grid_file(ds, os.path.dirname(os.path.abspath(filename)), profile)
+        ds = ds.drop_vars(['lat', 'lon'])
+        ds.attrs['grid_file'] = file_grid
+        for var in ds.data_vars:
+            if ds[var].attrs.get('coordinates') == 'time lat lon':
+                ds[var].attrs['coordinates'] = 'time'
+    if profile['pack']:
+        # the fill value of the packed values replaces any previous one
+        for var in ds.data_vars:
+            ds[var].attrs.pop('_FillValue', None)
+    file_tmp = f'{filename}.{os.getpid()}_{threading.get_ident()}.tmp'
+    ds.to_netcdf(
+        file_tmp, encoding=get_nc_encoding(ds, profile), unlimited_dims=unlimited_dims
+    )
+    os.replace(file_tmp, filename)
+
+def get_steps_range(get_steps):
+    # (min, max) of the finite values of all the steps
+    value_min, value_max = np.inf, -np.inf
+    for values in get_steps():
+        valid = values[np.isfinite(values)]
+        if valid.size > 0:
+            value_min = min(value_min, float(valid.min()))
+            value_max = max(value_max, float(valid.max()))
+    if value_min > value_max:
+        return 0., 0.
+    return value_min, value_max
+
+def write_dataset_by_steps(ds, filename, data_vars, profile = None):
+    # as write_dataset, but the data variables are written one time step at
+    # a time (a chunk per step), so they are never held in memory. ds: the
+    # coordinates and attributes of the file. data_vars: {var: (dims, attrs,
+    # get_steps)}, get_steps() yields the values of each index of the first
+    # dim in order (it is called twice with the packing of the archive
+    # profile: range first)
+    profile_name = profile
+    profile = get_nc_profile(profile)
+    shapes = {
+        var: tuple(ds.sizes[dim] for dim in dims)
+        for var, (dims, _, _) in data_vars.items()
+    }
+    file_tmp = f'{filename}.{os.getpid()}_{threading.get_ident()}.steps.tmp'
+    write_dataset(ds, file_tmp, profile_name)
+    with netCDF4.Dataset(file_tmp, 'a') as nc_dataset:
+        dedup_coords = 'grid_file' in nc_dataset.ncattrs()
+        for var, (dims, attrs, get_steps) in data_vars.items():
+            shape = shapes[var]
+            if profile['pack']:
+                encoding = get_packing_encoding_from_range(*get_steps_range(get_steps))
+                dtype, fill_value = encoding['dtype'], encoding['_FillValue']
+            else:
+                dtype, fill_value = get_working_dtype(), np.nan
+            # dims of the coordinates not saved (e.g. lat-lon in a grid file)
+            for dim, size in zip(dims, shape):
+                if dim not in nc_dataset.dimensions:
+                    nc_dataset.createDimension(dim, size)
+            kwargs = {}
+            if profile['zlib']:
+                kwargs = {'zlib': True, 'complevel': profile['complevel'], 'shuffle': True}
+            nc_var = nc_dataset.createVariable(
+                var, dtype, dims, fill_value=fill_value,
+                chunksizes=(1,) + shape[1:], **kwargs
+            )
+            attrs = {
+                key: value for key, value in attrs.items() if key != '_FillValue'
+            }
+            if dedup_coords and attrs.get('coordinates', '').endswith(' lat lon'):
+                attrs['coordinates'] = attrs['coordinates'][:-len(' lat lon')]
+            if profile['pack']:
+                attrs.update(
+                    scale_factor=encoding['scale_factor'],
+                    add_offset=encoding['add_offset']
+                )
+            nc_var.setncatts(attrs)
+            # values are packed by the xarray encoder, as in write_dataset
+            nc_var.set_auto_maskandscale(False)
+            for idx, values in enumerate(get_steps()):
+                if profile['pack']:
+                    nc_var[idx] = xr.conventions.encode_cf_variable(
+                        xr.Variable(dims[1:], values, encoding=dict(encoding))
+                    ).values
+                else:
+                    nc_var[idx] = values.astype(dtype, copy=False)
+    os.replace(file_tmp, filename)
+
+def get_nc_var_packing(nc_var):
+    # packing encoding of a variable saved with the archive profile (None if
+    # its values are not packed)
+    attrs = nc_var.ncattrs()
+    if 'scale_factor' not in attrs:
+        return None
+    return {
+        'dtype': str(nc_var.dtype),
+        'scale_factor': nc_var.getncattr('scale_factor'),
+        'add_offset': nc_var.getncattr('add_offset') if 'add_offset' in attrs else 0.,
+        '_FillValue': nc_var.getncattr('_FillValue')
+    }
+
+def is_in_packing_range(values, encoding):
+    valid = values[np.isfinite(values)]
+    if valid.size == 0:
+        return True
+    packed = np.round((valid - encoding['add_offset']) / encoding['scale_factor'])
+    return bool(np.abs(packed).max() <= PACK_MAX)
+
+def write_time_stacked_dataset(ds, filename, profile = None):
+    # one file with all the time steps (unlimited time dim). The file is
+    # written when it is created; the time steps of later calls which are
+    # not saved yet are appended at the end of the time dim, with the
+    # encoding of the file (packed values keep its scale and offset)
+    if not os.path.isfile(filename):
+        write_dataset(ds, filename, profile, unlimited_dims=['time'])
+        return
+    # the pooled dataset (read-only) would keep the file from being opened
+    # in append mode
+    nc_pool.close(filename)
+    with netCDF4.Dataset(filename, 'a') as nc_dataset:
+        nc_time = nc_dataset['time']
+        nc_time.set_auto_maskandscale(False)
+        times_saved = np.asarray(nc_time[:])
+        times, _, _ = xr.coding.times.encode_cf_datetime(
+            ds['time'].values, nc_time.units, getattr(nc_time, 'calendar', None)
+        )
+        is_new = ~np.isin(times, times_saved)
+        if not is_new.any():
+            return
+        ds = ds.isel(time=np.flatnonzero(is_new))
+        packings = {var: get_nc_var_packing(nc_dataset[var]) for var in ds.data_vars}
+        if all(
+            is_in_packing_range(ds[var].values, encoding)
+            for var, encoding in packings.items() if encoding is not None
+        ):
+            steps = slice(len(times_saved), len(times_saved) + int(is_new.sum()))
+            nc_time[steps] = times[is_new].astype(nc_time.dtype)
+            for var, encoding in packings.items():
+                nc_var = nc_dataset[var]
+                nc_var.set_auto_maskandscale(False)
+                if encoding is None:
+                    nc_var[steps] = ds[var].values.astype(nc_var.dtype, copy=False)
+                else:
+                    # packed by the xarray encoder, as in write_dataset
+                    nc_var[steps] = xr.conventions.encode_cf_variable(
+                        xr.Variable(ds[var].dims, ds[var].values, encoding=encoding)
+                    ).values
+            return
+    # values outside the packed range of the file: the file is rewritten
+    # with the range of all the time steps
+    print(f'INFO:LoadWriteData:new values outside the packed range of {filename}, rewriting it')
+    with xr.open_dataset(filename) as ds_saved:
+        ds_saved = ds_saved.load()
+    # lat-lon of the new time steps (the saved file may not hold them)
+    ds_saved = ds_saved.drop_vars(['lat', 'lon'], errors='ignore').assign_coords(
+        lat=ds['lat'].variable, lon=ds['lon'].variable
+    )
+    ds = xr.concat(
+        [ds_saved, ds], dim='time', coords='minimal', compat='override'
+    ).sortby('time')
+    write_dataset(ds, filename, profile, unlimited_dims=['time'])
+
+def is_date_in_nc(file_nc, date):
+    if not os.path.isfile(file_nc):
+        return False
+    nc_dataset = nc_pool.get(file_nc)
+    return bool(nc_dataset.time.isin([np.datetime64(date)]).any())
 
 def LoadPickle(pickleFile):
     file = open(pickleFile, 'rb')
@@ -183,5 +705,5 @@ def LoadPickle(pickleFile):
 
 def SavePickle(var, filename):
     file = open(filename, 'wb')
-    pickle.dump(var.copy(), file)
+    pickle.dump(var, file)
     file.close()
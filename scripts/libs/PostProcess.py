@@ -1,9 +1,12 @@
 import numpy as np
 
+# the input values are never modified (they may be cached or memory-mapped):
+# each function allocates its output once and works on it in place
+
 def KelvinToCelsius(tempK):
     print('INFO:PostProccess:convert Kelvin to Celsius')
-    tempC = tempK - 273.15
-    return tempC.copy()
+    tempC = np.subtract(tempK, 273.15)
+    return tempC
 
 def IrradianceToBrightnessTemperature(irradiance, v_c = 930.659 , A = 0.9983, B = 0.627):
     print('INFO:PostProccess:compute brightness temperature from irradiance values (channel 9)')
@@ -11,24 +14,37 @@ def IrradianceToBrightnessTemperature(irradiance, v_c = 930.659 , A = 0.9983, B
     c_1 = 1.19104e-5
     c_2 = 1.43877
     
-    term1 = ((c_1 * (v_c ** 3)) / irradiance) + 1
-    term2 = np.log(term1)
-    term3 = (c_2 * v_c / term2) - B
-    btK = (term3 / A)
-    btC = KelvinToCelsius(btK)
-    return btC.copy()
+    # term1 = c_1 * v_c^3 / irradiance + 1; term2 = log(term1)
+    # btK = (c_2 * v_c / term2 - B) / A; btC = btK - 273.15
+    values = np.divide(c_1 * (v_c ** 3), irradiance)
+    np.add(values, 1, out=values)
+    np.log(values, out=values)
+    np.divide(c_2 * v_c, values, out=values)
+    np.subtract(values, B, out=values)
+    np.divide(values, A, out=values)
+    print('INFO:PostProccess:convert Kelvin to Celsius')
+    np.subtract(values, 273.15, out=values)
+    return values
 
 def Reflectivity_dBZ(reflectivity):
     print('INFO:PostProccess:convert Reflectivity to dBZ units')
-    newValues = 10.0 * np.log10(np.maximum(1.0, 200.0 * reflectivity**1.6))
-    return newValues.copy()
+    # 10 * log10(max(1, 200 * reflectivity^1.6))
+    newValues = np.power(reflectivity, 1.6)
+    np.multiply(newValues, 200.0, out=newValues)
+    np.maximum(newValues, 1.0, out=newValues)
+    np.log10(newValues, out=newValues)
+    np.multiply(newValues, 10.0, out=newValues)
+    return newValues
 
 def MetersToMilimeters(values_m):
     print('INFO:PostProccess:convert Meters to Milimeters')
-    values_mm = values_m * 1000.0
-    return values_mm.copy()
+    values_mm = np.multiply(values_m, 1000.0)
+    return values_mm
 
 def compute_total_precipitation(list_precip):
     print('INFO:PostProccess:compute total precipitation from rain, graupel and snow')
-    pcp = np.sum(list_precip, axis = 0)
-    return pcp.copy()
+    # summed one field at a time (no stack of all the fields)
+    pcp = np.array(list_precip[0])
+    for precip in list_precip[1:]:
+        np.add(pcp, precip, out=pcp)
+    return pcp
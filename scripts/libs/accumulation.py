@@ -0,0 +1,81 @@
+from collections import deque
+import numpy as np
+
+# accumulations of hourly fields over sliding windows. The hours are walked
+# once in time order: each field is added to the running sums when it arrives
+# and subtracted when it leaves a window, so each hourly field is read once
+# whatever the number of windows (and window lengths) that contain it
+
+
+class SlidingAccumulator(object):
+    # running sums of the last accum_h hours for each accum_h of accum_hours.
+    # Sums are kept in float64, NaN are counted apart (a window with any NaN
+    # at a grid point is NaN there) and missing hours make a window incomplete
+    def __init__(self, accum_hours):
+        self.accum_hours = sorted(set(accum_hours))
+        # ring buffer of the last hours: (values, nan mask) or None if missing
+        self.fields = deque(maxlen=max(self.accum_hours))
+        self.sums = {}
+        self.nan_counts = {}
+        self.n_missing = dict.fromkeys(self.accum_hours, 0)
+
+    def allocate(self, shape):
+        for accum_h in self.accum_hours:
+            self.sums[accum_h] = np.zeros(shape, dtype=np.float64)
+            self.nan_counts[accum_h] = np.zeros(shape, dtype=np.int32)
+
+    def add(self, accum_h, field, sign):
+        if field is None:
+            self.n_missing[accum_h] += sign
+            return
+        values, nans = field
+        if sign > 0:
+            np.add(self.sums[accum_h], values, out=self.sums[accum_h], where=~nans)
+            self.nan_counts[accum_h] += nans
+        else:
+            np.subtract(self.sums[accum_h], values, out=self.sums[accum_h], where=~nans)
+            self.nan_counts[accum_h] -= nans
+
+    def push(self, values):
+        # values of the next hour (None if not available)
+        field = None
+        if values is not None:
+            if not self.sums:
+                self.allocate(values.shape)
+            elif values.shape != self.sums[self.accum_hours[0]].shape:
+                raise ValueError(
+                    f'hourly field with shape {values.shape}, expected '
+                    f'{self.sums[self.accum_hours[0]].shape}'
+                )
+            field = (values, np.isnan(values))
+        for accum_h in self.accum_hours:
+            # the oldest hour of the window leaves it
+            if len(self.fields) >= accum_h:
+                self.add(accum_h, self.fields[-accum_h], -1)
+            self.add(accum_h, field, 1)
+        self.fields.append(field)
+
+    def get(self, accum_h):
+        # accumulation of the last accum_h hours pushed (None if any of them
+        # is missing)
+        if len(self.fields) < accum_h or self.n_missing[accum_h] > 0:
+            return None
+        return np.where(self.nan_counts[accum_h] > 0, np.nan, self.sums[accum_h])
+
+
+def accumulate_windows(hourly_fields, windows):
+    # yields (accum_h, date_end, accumulated values) for each (accum_h,
+    # date_end) of windows whose hours are all available. hourly_fields:
+    # (date, values or None) of consecutive hours covering the windows
+    windows_end = {}
+    for accum_h, date_end in windows:
+        windows_end.setdefault(date_end, []).append(accum_h)
+    if not windows_end:
+        return
+    accumulator = SlidingAccumulator([accum_h for accum_h, _ in windows])
+    for date, values in hourly_fields:
+        accumulator.push(values)
+        for accum_h in windows_end.get(date, []):
+            acc_values = accumulator.get(accum_h)
+            if acc_values is not None:
+                yield accum_h, date, acc_values
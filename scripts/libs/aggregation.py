@@ -0,0 +1,65 @@
+from datetime import timedelta
+import numpy as np
+
+from LoadWriteData import read_field, build_dataset, write_dataset
+
+# hourly fields from sub-hourly obs files (e.g. every 15 or 30 minutes). The
+# files of an hour are read into a buffer and reduced at once along time:
+# sum for accumulations, mean for rates, max (e.g. reflectivity) or min (e.g.
+# brightness temperature). Any NaN makes the result NaN at that grid point
+AGGREGATIONS = ('sum', 'mean', 'max', 'min')
+
+
+def get_subhourly_dates(date_hour, freq_minutes, label = 'end'):
+    # dates of the files of the hour ending at date_hour. label: the file
+    # dates are the end (date_hour - 1h, date_hour] or the start
+    # [date_hour - 1h, date_hour) of their period
+    if 60 % freq_minutes != 0:
+        raise ValueError(f'sub-hourly frequency must divide 60 minutes: {freq_minutes}')
+    n_steps = 60 // freq_minutes
+    first = 1 if label == 'end' else 0
+    return [
+        date_hour - timedelta(minutes=60 - step * freq_minutes)
+        for step in range(first, n_steps + first)
+    ]
+
+def reduce_subhourly(buffer, aggregation):
+    # buffer: (n_steps, y, x)
+    if aggregation == 'sum':
+        return np.sum(buffer, axis=0, dtype=np.float64)
+    elif aggregation == 'mean':
+        return np.mean(buffer, axis=0, dtype=np.float64)
+    elif aggregation == 'max':
+        return np.max(buffer, axis=0)
+    elif aggregation == 'min':
+        return np.min(buffer, axis=0)
+    else:
+        raise ValueError(f'unknown aggregation: {aggregation}. Options: {AGGREGATIONS}')
+
+def aggregate_hour(files, fileformat, var, aggregation):
+    # (values, grid) of the hour from its sub-hourly files
+    buffer = None
+    for idx, filename in enumerate(files):
+        field = read_field(filename, fileformat, var)
+        if buffer is None:
+            buffer = np.empty((len(files),) + field.data.shape, dtype=field.data.dtype)
+            grid = field.grid
+        buffer[idx] = field.data
+    return reduce_subhourly(buffer, aggregation), grid
+
+def write_hourly_obs(task, fileformat, var, aggregation, attrs_var):
+    # aggregates and saves an hour (task: date of the hour, sub-hourly files,
+    # hourly file). Run by the link_obs workers
+    date_hour, files, file_hourly = task
+    values, (lat, lon) = aggregate_hour(files, fileformat, var, aggregation)
+    ds = build_dataset(
+        values=values,
+        date=date_hour,
+        lat=lat,
+        lon=lon,
+        var_name=var,
+        attrs_var=attrs_var
+    )
+    write_dataset(ds, file_hourly)
+    print(f"INFO: file '{file_hourly}' saved ({aggregation} of {len(files)} files)")
+    return file_hourly
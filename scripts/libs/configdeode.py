@@ -12,6 +12,9 @@ import pyproj
 
 from LoadWriteData import LoadConfigFileFromYaml
 
+# earth radius (m) of the spherical earth used by HARMONIE-AROME
+earth_radius_deode = 6371229
+
 vars_dict_deode = {
     "pcp": {
         "var": [
@@ -80,6 +83,12 @@ class ConfigDeode(object):
             self._exp_dict["format"]["filepaths"] = [replaced_filepath,]
             self._exp_dict["format"]["filename"] = replaced_filename
             self._exp_dict["format"]["fileformat"] = "Grib"
+            self._exp_dict["format"]["projection"] = \
+                f"{self._get_proj4()} +R={earth_radius_deode}"
+            self._exp_dict["regrid"] = {
+                "method": "linear",
+                "structured": True
+            }
             self._exp_dict["inits"] = init_dict
             self._exp_dict["vars"] = self._vars_dict
 
@@ -196,11 +205,14 @@ class ConfigDeode(object):
             fcsts.append(date_fcst.strftime("%Y%m%d%H"))
         return inits, fcsts
 
-    def _compute_extension(self):
+    def _get_proj4(self):
         proj4 = "+proj=lcc " \
             + f"+lat_0={self.data['XLAT0']} +lon_0={self.data['XLON0']} " \
             + f"+lat_1={self.data['XLAT0']} +lat_2={self.data['XLAT0']}"
-        projection = pyproj.Proj(proj4)
+        return proj4
+
+    def _compute_extension(self):
+        projection = pyproj.Proj(self._get_proj4())
         half_height = int(self.data["NJMAX"] / 2) * self.data["XDY"]
         half_width = int(self.data["NIMAX"] / 2) * self.data["XDX"]
         x_0, y_0 = projection(self.data["XLONCEN"], self.data["XLATCEN"])
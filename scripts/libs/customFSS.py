@@ -0,0 +1,71 @@
+import numpy as np
+
+# Fractions Skill Score (FSS) for all the thresholds and scales of a time step
+# at once. Same definition as pysteps.verification.spatialscores.fss (non
+# finite values are below any threshold, fractions from a uniform filter
+# with zero padding), but the fractions are computed from one summed-area
+# table per threshold: the cost of each scale does not depend on its size.
+# Fractions are kept as counts of pixels above the threshold (exact integers
+# in float64), as the window area cancels out in the score
+
+
+def get_binary_fields(values, thresholds):
+    # (n_thresholds, y, x) boolean array. Each threshold is compared as
+    # pysteps does (in the dtype of values)
+    binary = np.empty((len(thresholds),) + values.shape, dtype=bool)
+    finite = np.isfinite(values)
+    for idx, thr in enumerate(thresholds):
+        np.greater_equal(values, thr, out=binary[idx])
+        binary[idx] &= finite
+    return binary
+
+def get_summed_area_tables(binary, pad):
+    # tables with a leading row and column of zeros, extended with pad rows
+    # and columns on each side repeating the edges: the sum of
+    # binary[:, i0:i1, j0:j1] (indices clipped to the domain) is
+    # t[i1, j1] - t[i0, j1] - t[i1, j0] + t[i0, j0], t = table[:, pad:, pad:]
+    n_thr, n_y, n_x = binary.shape
+    table = np.zeros((n_thr, n_y + 1, n_x + 1), dtype=np.float64)
+    np.cumsum(binary, axis=1, out=table[:, 1:, 1:])
+    np.cumsum(table[:, 1:, 1:], axis=2, out=table[:, 1:, 1:])
+    return np.pad(table, ((0, 0), (pad, pad), (pad, pad)), mode='edge')
+
+def get_window_counts(table, pad, shape, scale):
+    # pixels above each threshold in the window of each pixel, as
+    # scipy.ndimage.uniform_filter (window [i - scale//2, i - scale//2 + scale),
+    # zero padding)
+    n_y, n_x = shape
+    ini = pad - scale // 2
+    end = ini + scale
+    return (
+        table[:, end:end + n_y, end:end + n_x] - table[:, ini:ini + n_y, end:end + n_x]
+        - table[:, end:end + n_y, ini:ini + n_x] + table[:, ini:ini + n_y, ini:ini + n_x]
+    )
+
+def get_sum_products(counts_a, counts_b):
+    # sum over the domain of counts_a * counts_b for each threshold
+    return np.einsum('ti,ti->t', counts_a.reshape(len(counts_a), -1), counts_b.reshape(len(counts_b), -1))
+
+def fss_matrix(X_f, X_o, thresholds, scales):
+    # FSS of forecast X_f against observation X_o: array with shape
+    # (n_thresholds, n_scales)
+    if X_f.ndim != 2 or X_f.shape != X_o.shape:
+        raise ValueError("X_f and X_o must be two-dimensional arrays having the same shape")
+    # windows larger than twice the domain cover it from any pixel
+    scales = [min(max(int(scale), 1), 2 * max(X_f.shape)) for scale in scales]
+    pad = max(scales)
+    table_f = get_summed_area_tables(get_binary_fields(X_f, thresholds), pad)
+    table_o = get_summed_area_tables(get_binary_fields(X_o, thresholds), pad)
+    scores = np.empty((len(thresholds), len(scales)), dtype=np.float64)
+    for idx, scale in enumerate(scales):
+        counts_f = get_window_counts(table_f, pad, X_f.shape, scale)
+        counts_o = get_window_counts(table_o, pad, X_o.shape, scale)
+        sum_fct_sq = get_sum_products(counts_f, counts_f)
+        sum_fct_obs = get_sum_products(counts_f, counts_o)
+        sum_obs_sq = get_sum_products(counts_o, counts_o)
+        numer = sum_fct_sq - 2. * sum_fct_obs + sum_obs_sq
+        denom = sum_fct_sq + sum_obs_sq
+        # no pixels above the threshold in both fields: undefined (NaN)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores[:, idx] = 1. - numer / denom
+    return scores
@@ -103,8 +103,7 @@ def SAL(
     :py:func:`pysteps.verification.salscores.sal_location`,
     :py:mod:`pysteps.feature.tstorm`
     """
-    prediction = np.copy(prediction)
-    observation = np.copy(observation)
+    # inputs are not modified by the SAL components (no copies)
     structure = sal_structure(
         prediction, observation, thr_factor, thr_quantile, tstorm_kwargs
     )
@@ -193,8 +192,8 @@ def sal_amplitude(prediction, observation):
     :py:func:`pysteps.verification.salscores.sal_structure`,
     :py:func:`pysteps.verification.salscores.sal_location`
     """
-    mean_obs = np.nanmean(observation)
-    mean_pred = np.nanmean(prediction)
+    mean_obs = np.nanmean(observation, dtype=np.float64)
+    mean_pred = np.nanmean(prediction, dtype=np.float64)
     return (mean_pred - mean_obs) / (0.5 * (mean_pred + mean_obs))
 
 
@@ -395,7 +394,7 @@ def _sal_scaled_volume(precip_objects):
         )
     objects_volume_scaled = []
     for _, precip_object in precip_objects.iterrows():
-        intensity_sum = np.nansum(precip_object.intensity_image)
+        intensity_sum = np.nansum(precip_object.intensity_image, dtype=np.float64)
         max_intensity = precip_object.max_intensity
         if intensity_sum == 0:
             intensity_vol = 0
@@ -463,9 +462,9 @@ def _sal_weighted_distance(precip, thr_factor, thr_quantile, tstorm_kwargs):
         yd = (precip_objects["weighted_centroid-0"][i] - centroid_total[0]) ** 2
 
         dst = sqrt(xd + yd)
-        sumr = (np.nansum(precip_objects.intensity_image[i])) * dst
+        sumr = (np.nansum(precip_objects.intensity_image[i], dtype=np.float64)) * dst
 
-        sump = np.nansum(precip_objects.intensity_image[i])
+        sump = np.nansum(precip_objects.intensity_image[i], dtype=np.float64)
 
         r.append({"sum_dist": sumr, "sum_p": sump})
     rr = pd.DataFrame(r)
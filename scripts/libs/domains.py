@@ -13,8 +13,50 @@ def set_domain_verif(valid_time, verif_domains):
             verif_domain = None
     return verif_domain
 
-def CropDomainsFromBounds(data, lat2D, lon2D, bounds):
+def get_crop_indices(lat2D, lon2D, bounds):
     lonMin, lonMax, latMin, latMax = bounds
     ids = np.argwhere((lat2D >= latMin) & (lat2D <= latMax) & (lon2D >= lonMin) & (lon2D <= lonMax))
     idLatIni, idLatEnd, idLonIni, idLonEnd = ids[:,0].min(), ids[:,0].max() + 1, ids[:,1].min(), ids[:,1].max() + 1
-    return data[idLatIni:idLatEnd, idLonIni:idLonEnd].copy()
+    return idLatIni, idLatEnd, idLonIni, idLonEnd
+
+def CropDomainsFromIndices(data, indices, copy = False):
+    # view of data (copy = True if the cropped values are going to be modified
+    # while data must not)
+    idLatIni, idLatEnd, idLonIni, idLonEnd = indices
+    cropped = data[idLatIni:idLatEnd, idLonIni:idLonEnd]
+    if copy:
+        return cropped.copy()
+    return cropped
+
+def CropDomainsFromBounds(data, lat2D, lon2D, bounds, copy = False):
+    return CropDomainsFromIndices(data, get_crop_indices(lat2D, lon2D, bounds), copy)
+
+def ResolutionToDegrees(resolution):
+    # resolution str from obs config (e.g. '0.1 º', '3 km') to degrees
+    valueStr, units = resolution.split(' ')
+    if units == 'km':
+        return float(valueStr) / 111.2
+    elif units == 'm':
+        return float(valueStr) / 111200.
+    else:
+        return float(valueStr)
+
+def ExpandBounds(bounds, halo, limits=None):
+    lonMin, lonMax, latMin, latMax = bounds
+    newBounds = [lonMin - halo, lonMax + halo, latMin - halo, latMax + halo]
+    if limits is not None:
+        newBounds = [
+            max(newBounds[0], limits[0]), min(newBounds[1], limits[1]),
+            max(newBounds[2], limits[2]), min(newBounds[3], limits[3])
+        ]
+    return newBounds
+
+def get_verif_window(valid_times, verif_domains, halo=0., limits=None):
+    # union of the verif domains of all the valid times (plus a halo). None if
+    # any valid time has not a verif domain
+    boxes = [set_domain_verif(valid_time, verif_domains) for valid_time in valid_times]
+    if len(boxes) == 0 or any(box is None for box in boxes):
+        return None
+    boxes = np.array(boxes, dtype=float)
+    union = [boxes[:, 0].min(), boxes[:, 1].max(), boxes[:, 2].min(), boxes[:, 3].max()]
+    return ExpandBounds(union, halo, limits)
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+import numpy as np
+
+
+def set_read_only(field):
+    # held fields (and the views of them handed on) are shared by the later
+    # lead times: any attempt to modify them in place raises
+    if isinstance(field, np.ndarray):
+        field.setflags(write=False)
+    elif isinstance(field, list):
+        for values in field:
+            set_read_only(values)
+    return field
+
+
+class FieldCache(object):
+    # fields already decoded (and cropped) during a run, keyed by (file,
+    # variable). The least recently used field is discarded when more than
+    # max_fields are held. Fields are returned read-only
+    def __init__(self, max_fields=4):
+        self.max_fields = max_fields
+        self.fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(filename, var):
+        # var may be a str, a list or a dict of grib keys
+        return (filename, repr(var))
+
+    def get(self, filename, var, load_function):
+        # load_function(filename, var) is only called if the field is not held
+        key = self._key(filename, var)
+        if key in self.fields:
+            self.hits += 1
+            self.fields.move_to_end(key)
+            return self.fields[key]
+        self.misses += 1
+        field = load_function(filename, var)
+        if self.max_fields > 0:
+            set_read_only(field)
+            self.fields[key] = field
+            while len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        return field
+
+    def clear(self):
+        self.fields.clear()
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return (
+            f"FieldCache({len(self.fields)}/{self.max_fields} fields, "
+            f"hits: {self.hits}, misses: {self.misses})"
+        )
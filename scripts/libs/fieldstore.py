@@ -0,0 +1,118 @@
+import os
+import threading
+import hashlib
+import numpy as np
+
+from runtime import get_runtime_settings, get_working_dtype
+
+# decoded fields saved as .npy files and read back as memory maps, so that
+# later stages and re-runs do not decode the same grib/HDF5/netCDF fields
+# again. Fields are keyed by the fingerprint of the source file (path, size,
+# mtime) and the variable, date, window and dtype read. When the store
+# exceeds max_size (GB), the least recently used fields are removed
+
+def fill_masked(values):
+    # masked values (e.g. grib bitmaps) as NaN, so that the fields read from
+    # the files and those read back from the store are the same
+    if not isinstance(values, np.ma.MaskedArray):
+        return values
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(get_working_dtype())
+    return np.ma.filled(values, np.nan)
+
+class FieldStore(object):
+    def __init__(self, path='cache/fields', max_size=10.):
+        self.path = path
+        self.max_bytes = int(max_size * 1024**3)
+        self.size = None
+
+    @staticmethod
+    def get_key(filename, fileformat, var, date=None, window=None):
+        stat = os.stat(filename)
+        if window is not None:
+            window = tuple(int(idx) for idx in window)
+        fingerprint = (
+            os.path.realpath(filename), stat.st_size, stat.st_mtime_ns,
+            fileformat, repr(var), str(date), window, str(get_working_dtype())
+        )
+        return hashlib.sha1(repr(fingerprint).encode()).hexdigest()
+
+    def get_filename(self, key):
+        return os.path.join(self.path, f'{key}.npy')
+
+    def load(self, key):
+        # read-only memory map of the field (None if not stored)
+        filename = self.get_filename(key)
+        try:
+            values = np.load(filename, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # mark as recently used
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+        return values
+
+    def save(self, key, values):
+        # masked arrays are not stored: np.save would drop their mask (see
+        # fill_masked)
+        if (
+            not isinstance(values, np.ndarray) or isinstance(values, np.ma.MaskedArray)
+            or values.dtype == object
+        ):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        filename = self.get_filename(key)
+        file_tmp = f'{filename}.{os.getpid()}_{threading.get_ident()}.tmp.npy'
+        np.save(file_tmp, np.ascontiguousarray(values))
+        os.replace(file_tmp, filename)
+        if self.size is None:
+            self.size = self.get_size()
+        else:
+            self.size += os.path.getsize(filename)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def list_fields(self):
+        # (mtime, size, filename) of the stored fields, oldest first
+        fields = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy') and not entry.name.endswith('.tmp.npy'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    fields.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(fields)
+
+    def get_size(self):
+        return sum(size for _, size, _ in self.list_fields())
+
+    def evict(self):
+        fields = self.list_fields()
+        self.size = sum(size for _, size, _ in fields)
+        for _, size, filename in fields:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+        print(f'INFO:fieldstore:store reduced to {self.size / 1024**3:.2f} GB')
+
+
+field_store = None
+
+def get_field_store():
+    # store of the run (None if disabled in config/config_runtime.yaml)
+    global field_store
+    if field_store is None:
+        settings = get_runtime_settings()['field_store']
+        if settings['enabled']:
+            field_store = FieldStore(settings['path'], float(settings['max_size']))
+        else:
+            field_store = False
+    return field_store or None
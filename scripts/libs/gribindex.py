@@ -0,0 +1,109 @@
+import os
+import threading
+import hashlib
+import pickle
+import pygrib
+
+# sidecar indexes of grib files: byte offset, length and identification keys
+# of each message, so that a variable is read decoding only its message. The
+# index of a file is rebuilt if its size or modification time change
+CACHE_DIR = 'cache/grib_index'
+INDEX_KEYS = (
+    'shortName', 'level', 'typeOfLevel', 'discipline', 'parameterCategory',
+    'parameterNumber', 'jScansPositively'
+)
+
+
+def get_file_id(file_grib):
+    stat = os.stat(file_grib)
+    return (os.path.realpath(file_grib), stat.st_size, stat.st_mtime_ns)
+
+def get_index_filename(file_id, cache_dir=CACHE_DIR):
+    sha = hashlib.sha1(file_id[0].encode()).hexdigest()
+    return os.path.join(cache_dir, f'{sha}.pkl')
+
+def get_msg_keys(grb):
+    keys = {}
+    for key in INDEX_KEYS:
+        try:
+            keys[key] = grb[key]
+        except (KeyError, RuntimeError, ValueError):
+            keys[key] = None
+    return keys
+
+def build_grib_index(file_grib):
+    print(f'INFO:gribindex:indexing {file_grib}')
+    entries = []
+    offset = 0
+    with open(file_grib, 'rb') as stream:
+        grbs = pygrib.open(file_grib)
+        for grb in grbs:
+            # messages may be separated by padding bytes
+            stream.seek(offset)
+            while True:
+                chunk = stream.read(4)
+                if chunk == b'GRIB' or len(chunk) < 4:
+                    break
+                offset += 1
+                stream.seek(offset)
+            entry = get_msg_keys(grb)
+            entry['offset'] = offset
+            entry['totalLength'] = grb['totalLength']
+            entries.append(entry)
+            offset += entry['totalLength']
+        grbs.close()
+    return entries
+
+def load_grib_index(file_grib, cache_dir=CACHE_DIR):
+    file_id = get_file_id(file_grib)
+    file_index = get_index_filename(file_id, cache_dir)
+    if os.path.isfile(file_index):
+        try:
+            with open(file_index, 'rb') as stream:
+                index = pickle.load(stream)
+            if index['file_id'] == file_id:
+                return index['entries']
+        except (EOFError, pickle.UnpicklingError, KeyError):
+            pass
+    entries = build_grib_index(file_grib)
+    # write to a temporary file first: several processes (or threads) may
+    # index the file
+    os.makedirs(cache_dir, exist_ok=True)
+    file_tmp = f'{file_index}.{os.getpid()}_{threading.get_ident()}.tmp'
+    with open(file_tmp, 'wb') as stream:
+        pickle.dump({'file_id': file_id, 'entries': entries}, stream)
+    os.replace(file_tmp, file_index)
+    return entries
+
+def find_entry(entries, code):
+    # same selection as LoadWriteData.get_msg_from_code. None if the code can
+    # not be solved with the index keys
+    if isinstance(code, int):
+        if 1 <= code <= len(entries):
+            return entries[code - 1]
+        return None
+    elif isinstance(code, str):
+        for entry in entries:
+            if entry['shortName'] == code:
+                return entry
+        if '|' in code:
+            name, lev = code.split('|')
+            return find_entry(entries, {'shortName': name, 'level': int(lev)})
+        return None
+    elif isinstance(code, dict):
+        if any(key not in INDEX_KEYS for key in code.keys()):
+            return None
+        for entry in entries:
+            if all(entry[key] == value for key, value in code.items()):
+                return entry
+        return None
+    else:
+        raise TypeError(f'wrong var dtype: {type(code)}')
+
+def read_msg(file_grib, entry, stream=None):
+    # decode only the message of the entry (stream: file already opened)
+    if stream is None:
+        with open(file_grib, 'rb') as stream:
+            return read_msg(file_grib, entry, stream)
+    stream.seek(entry['offset'])
+    return pygrib.fromstring(stream.read(entry['totalLength']))
@@ -0,0 +1,74 @@
+import os
+import threading
+import hashlib
+import numpy as np
+
+# lat-lon grids already computed, keyed by the definition of the geometry
+# (all the files of an exp or an obs database share it). Grids are held in
+# memory during a run and saved as .npy files to be reused by later runs
+CACHE_DIR = 'cache/grids'
+GRIB_GRID_KEYS = (
+    'gridType', 'Nx', 'Ny', 'Ni', 'Nj',
+    'latitudeOfFirstGridPointInDegrees', 'longitudeOfFirstGridPointInDegrees',
+    'latitudeOfLastGridPointInDegrees', 'longitudeOfLastGridPointInDegrees',
+    'md5GridSection'
+)
+HDF5_GRID_KEYS = ('projdef', 'LL_lat', 'LL_lon', 'UR_lat', 'UR_lon', 'xsize', 'ysize')
+
+grids = {}
+# grid definitions of the netCDF files already read
+nc_definitions = {}
+
+
+def get_grid_key(definition):
+    return hashlib.sha1(repr(definition).encode()).hexdigest()
+
+def get_grib_grid_definition(msg, lat_must_flip):
+    definition = [('format', 'Grib'), ('lat_must_flip', lat_must_flip)]
+    for key in GRIB_GRID_KEYS:
+        try:
+            definition.append((key, msg[key]))
+        except (KeyError, RuntimeError, ValueError):
+            pass
+    return tuple(definition)
+
+def get_HDF5_grid_definition(where_attrs):
+    return (('format', 'HDF5'),) + tuple(
+        (key, np.asarray(where_attrs[key]).tolist()) for key in HDF5_GRID_KEYS
+    )
+
+def get_nc_grid_definition(file_nc, nc_dataset):
+    # checksum of the full lat-lon arrays. It is computed once per file and
+    # run (keyed by path, size and mtime as in fieldstore)
+    stat = os.stat(file_nc)
+    file_key = (os.path.realpath(file_nc), stat.st_size, stat.st_mtime_ns)
+    if file_key not in nc_definitions:
+        checksum = hashlib.sha1()
+        for var in ('lat', 'lon'):
+            values = np.ascontiguousarray(nc_dataset[var].values)
+            checksum.update(f'{var}{values.shape}{values.dtype}'.encode())
+            checksum.update(values.tobytes())
+        nc_definitions[file_key] = (('format', 'netCDF'), ('sha1', checksum.hexdigest()))
+    return nc_definitions[file_key]
+
+def get_cached_grid(definition, compute_function, cache_dir=CACHE_DIR):
+    # (lat, lon) of the geometry: from memory, from disk or computed by
+    # compute_function() and saved. Arrays are read-only, as they are shared
+    key = get_grid_key(definition)
+    if key in grids:
+        return grids[key]
+    file_grid = os.path.join(cache_dir, f'{key}.npy')
+    if os.path.isfile(file_grid):
+        lat_lon = np.load(file_grid)
+        lat, lon = lat_lon[0], lat_lon[1]
+    else:
+        lat, lon = compute_function()
+        os.makedirs(cache_dir, exist_ok=True)
+        file_tmp = f'{file_grid}.{os.getpid()}_{threading.get_ident()}.tmp.npy'
+        np.save(file_tmp, np.stack([lat, lon]))
+        os.replace(file_tmp, file_grid)
+        print(f'INFO:gridcache:grid saved in {file_grid}')
+    lat.setflags(write=False)
+    lon.setflags(write=False)
+    grids[key] = (lat, lon)
+    return grids[key]
@@ -0,0 +1,195 @@
+import os
+import threading
+import hashlib
+import pickle
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from times import lead_time_replace
+from LoadWriteData import read_field
+
+INVENTORY_CACHE_DIR = 'cache/obs_index'
+
+
+class InputCatalog(object):
+    # resolves the input files of exps (init, lead time) and obs (valid time)
+    # to their real paths. Each directory is listed only once (os.scandir),
+    # so checking thousands of files does not hit the file system each time
+    def __init__(self):
+        self.listings = {}
+
+    def list_dir(self, directory):
+        if directory not in self.listings:
+            try:
+                with os.scandir(directory) as entries:
+                    self.listings[directory] = {entry.name for entry in entries}
+            except (FileNotFoundError, NotADirectoryError):
+                self.listings[directory] = set()
+        return self.listings[directory]
+
+    def exists(self, path):
+        directory, filename = os.path.split(path)
+        return filename in self.list_dir(directory)
+
+    def resolve(self, templates, date, lead_time=None):
+        # first path (strftime format with optional %LL lead time placeholders)
+        # which exists for date. None if not found
+        for template in templates:
+            if lead_time is not None:
+                template = lead_time_replace(template, lead_time)
+            path = date.strftime(template)
+            if self.exists(path):
+                return path
+        return None
+
+    def link(self, path, directory):
+        # symbolic link to path in directory (only if links are requested)
+        destin = os.path.join(directory, os.path.basename(path))
+        if not self.exists(destin):
+            os.makedirs(directory, exist_ok=True)
+            os.symlink(os.path.abspath(path), destin)
+            self.list_dir(directory).add(os.path.basename(path))
+            print(f"INFO: link {destin} --> {path} created")
+        return destin
+
+    def add(self, path):
+        # register a file created during the run
+        directory, filename = os.path.split(path)
+        self.list_dir(directory).add(filename)
+
+
+class ObsInventory(object):
+    # valid time -> path of the obs files of templates (the first template
+    # wins, as in InputCatalog.resolve). Each folder is listed once and the
+    # valid times are parsed from the file names with the strptime pattern
+    # of the template. The inventory is saved as a sorted index, which is
+    # rebuilt only if a folder is modified (files added or removed)
+    def __init__(self, templates, cache_dir=INVENTORY_CACHE_DIR):
+        self.templates = templates
+        # templates with dates in the folder can not be listed once: their
+        # files are resolved date by date
+        self.catalog = InputCatalog()
+        self.dated_templates = [
+            template for template in templates
+            if '%' in os.path.dirname(template)
+        ]
+        sha = hashlib.sha1(repr(templates).encode()).hexdigest()
+        self.file_index = os.path.join(cache_dir, f'{sha}.pkl')
+        self.entries = self.load_index()
+        self.dates = sorted(self.entries.keys())
+
+    def get_folders_id(self):
+        folders_id = []
+        for template in self.templates:
+            if template in self.dated_templates:
+                continue
+            folder = os.path.dirname(template) or '.'
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            folders_id.append((os.path.realpath(folder), mtime))
+        return folders_id
+
+    def build_index(self):
+        print(f'INFO:inputcatalog:indexing obs files of {self.templates}')
+        entries = {}
+        for template in reversed(self.templates):
+            if template in self.dated_templates:
+                continue
+            folder, pattern = os.path.split(template)
+            for filename in self.catalog.list_dir(folder or '.'):
+                try:
+                    date = datetime.strptime(filename, pattern)
+                except ValueError:
+                    continue
+                entries[date] = os.path.join(folder, filename)
+        return entries
+
+    def load_index(self):
+        folders_id = self.get_folders_id()
+        if os.path.isfile(self.file_index):
+            try:
+                with open(self.file_index, 'rb') as stream:
+                    index = pickle.load(stream)
+                if index['folders_id'] == folders_id:
+                    return dict(index['entries'])
+            except (EOFError, pickle.UnpicklingError, KeyError):
+                pass
+        entries = self.build_index()
+        os.makedirs(os.path.dirname(self.file_index), exist_ok=True)
+        file_tmp = f'{self.file_index}.{os.getpid()}_{threading.get_ident()}.tmp'
+        with open(file_tmp, 'wb') as stream:
+            pickle.dump(
+                {'folders_id': folders_id, 'entries': sorted(entries.items())},
+                stream
+            )
+        os.replace(file_tmp, self.file_index)
+        return entries
+
+    def get(self, date):
+        # path of the obs at date (None if not found)
+        path = self.entries.get(date)
+        if path is None and len(self.dated_templates) > 0:
+            path = self.catalog.resolve(self.dated_templates, date)
+        return path
+
+    def __contains__(self, date):
+        return self.get(date) is not None
+
+    def between(self, date_ini, date_end):
+        # dates indexed in [date_ini, date_end]
+        return self.dates[
+            bisect_left(self.dates, date_ini):bisect_right(self.dates, date_end)
+        ]
+
+    def gaps(self, dates):
+        # dates without obs
+        return [date for date in dates if date not in self]
+
+    def coverage(self, dates):
+        # fraction of dates with obs
+        if len(dates) == 0:
+            return 0.
+        return 1. - len(self.gaps(dates)) / len(dates)
+
+    def read_field(self, date, fileformat, vars = [], window = None):
+        return read_field(self.get(date), fileformat, vars, window=window)
+
+
+def get_obs_file_info(config_obs_db, var_verif, accum_h):
+    # name and format of the obs files verified: the files of the database,
+    # or those written by link_obs.py (accumulated values, or hourly values
+    # aggregated from sub-hourly files)
+    obs_filename = config_obs_db['format']['filename'][var_verif]
+    obs_stem = '.'.join(obs_filename.split('.')[:-1])
+    if accum_h > 1:
+        return f"acc{accum_h}h_{obs_stem}.nc", "netCDF"
+    elif config_obs_db['vars'][var_verif].get('subhourly'):
+        return f"1h_{obs_stem}.nc", "netCDF"
+    return obs_filename, config_obs_db['format']['fileformat']
+
+def get_obs_templates(config_obs_db, obs, relative_indexed_path, case, obs_filename):
+    # obs are searched in the case folder (links and accumulated values) and
+    # in the original path of the database
+    return [
+        os.path.join(
+            f"OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}",
+            obs_filename
+        ),
+        os.path.join(config_obs_db['path'], obs_filename)
+    ]
+
+def get_exp_templates(config_exp, exp, init_time, relative_indexed_path):
+    # exp files are searched in the links folder and in the original path
+    exp_filename = config_exp['format']['filename']
+    files_orig_path = config_exp['format']['filepaths'][
+        config_exp['inits'][init_time]['path']
+    ].replace('%exp', exp)
+    return [
+        os.path.join(
+            f"SIMULATIONS/{relative_indexed_path}/{exp}/data_orig/{init_time}",
+            exp_filename
+        ),
+        os.path.join(files_orig_path, exp_filename)
+    ]
@@ -60,3 +60,18 @@ class NamingFormatter(object):
             return valid_time.strftime(template_str)
         else:
             return template_str
+
+    def format_regrid(self, init_time, lead_time, acc_h):
+        # regridded exps are saved in one file per lead time (default) or in
+        # one time-stacked file per init ("regrid": "output": init)
+        config_regrid = self.config_exp.get("regrid") or {}
+        if config_regrid.get("output", "leadtime") == "init":
+            template = "regrid_init"
+        else:
+            template = "regrid"
+        return self.format_string(
+            template=template,
+            init_time=init_time,
+            lead_time=lead_time,
+            acc_h=acc_h
+        )
@@ -0,0 +1,146 @@
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from LoadWriteData import check_is_typelist, read_field, write_dataset_by_steps, nc_pool
+from inputcatalog import ObsInventory
+from domains import get_crop_indices, CropDomainsFromIndices
+from prefetch import Prefetcher
+from runtime import get_runtime_settings
+
+# case cube of an obs: the hourly (and accumulated) obs of a case cropped once
+# to NOzoom plus a halo and stacked along time in a single netCDF file. It is
+# built by link_obs.py (obs_cube in config/config_runtime.yaml) and the other
+# steps read their time steps from it instead of the full obs files
+
+
+def get_cube_filename(obs, case, relative_indexed_path):
+    return f"OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}/cube_{obs}_{case}.nc"
+
+def get_cube_var(var, accum_h):
+    # name of the variable (and of its time dimension) in the cube
+    if accum_h > 1:
+        return f'{var}_acc{accum_h}h', f'time_acc{accum_h}h'
+    return var, 'time'
+
+def get_cube_dates(ds, time_dim):
+    return list(pd.to_datetime(ds[time_dim].values).to_pydatetime())
+
+def read_steps(files, dates, fileformat, var, window):
+    # values of the dates, cropped to window (the next ones are read in
+    # advance)
+    for _, field in Prefetcher(
+        dates,
+        lambda date: read_field(files[date], fileformat, var, window=window)
+    ):
+        yield field.data
+
+def build_obs_cube(file_cube, products, bounds, attrs_nc = {}):
+    # products: {accum_h: (fileformat, var, {date: file}, attrs_var)}. The
+    # files of a product share the grid. The cube is not rebuilt if it
+    # already holds the same dates and bounds
+    products = {
+        accum_h: product for accum_h, product in products.items()
+        if len(product[2]) > 0
+    }
+    if len(products) == 0:
+        return
+    if os.path.isfile(file_cube):
+        ds_cube = nc_pool.get(file_cube)
+        if list(ds_cube.attrs.get('bounds', [])) == list(bounds) and all(
+            get_cube_var(var, accum_h)[0] in ds_cube.data_vars
+            and get_cube_dates(ds_cube, get_cube_var(var, accum_h)[1]) == sorted(files.keys())
+            for accum_h, (_, var, files, _) in products.items()
+        ):
+            print(f"INFO: obs cube '{file_cube}' up to date")
+            return
+    # grid and crop window of each product
+    windows = {}
+    grid = None
+    for accum_h, (fileformat, var, files, _) in products.items():
+        # the accumulated files of link_obs.py only hold the case domain:
+        # the window is computed on the grid of each product
+        lat, lon = read_field(files[min(files.keys())], fileformat).grid
+        windows[accum_h] = get_crop_indices(lat, lon, bounds)
+        lat_cube = CropDomainsFromIndices(lat, windows[accum_h])
+        lon_cube = CropDomainsFromIndices(lon, windows[accum_h])
+        if grid is None:
+            grid = (lat_cube, lon_cube)
+        elif lat_cube.shape != grid[0].shape or not (
+            np.allclose(lat_cube, grid[0]) and np.allclose(lon_cube, grid[1])
+        ):
+            raise ValueError(
+                f'{get_cube_var(var, accum_h)[0]} files do not cover the grid of the obs cube'
+            )
+    # the time steps are read and written one at a time
+    coords = {
+        'lat': (('y', 'x'), grid[0], {"units": "degrees_north"}),
+        'lon': (('y', 'x'), grid[1], {"units": "degrees_east"}),
+    }
+    data_vars = {}
+    for accum_h, (fileformat, var, files, attrs_var) in products.items():
+        var_cube, time_dim = get_cube_var(var, accum_h)
+        dates = sorted(files.keys())
+        coords[time_dim] = dates
+        print(f"INFO: adding {len(dates)} time steps of {var_cube} to the obs cube")
+        data_vars[var_cube] = (
+            (time_dim, 'y', 'x'),
+            dict(attrs_var, coordinates=f'{time_dim} lat lon'),
+            partial(read_steps, files, dates, fileformat, var, windows[accum_h])
+        )
+    ds = xr.Dataset(
+        coords=coords,
+        attrs=dict(
+            attrs_nc,
+            bounds=list(bounds),
+            history='file created for spatial verification purposes'
+        )
+    )
+    nc_pool.close(file_cube)
+    write_dataset_by_steps(ds, file_cube, data_vars)
+    print(f"INFO: obs cube '{file_cube}' saved")
+
+
+class ObsCube(object):
+    # time steps of an obs in the case cube, with the same queries as
+    # inputcatalog.ObsInventory (get, in, gaps, coverage, read_field)
+    def __init__(self, file_cube, var, accum_h):
+        self.filename = file_cube
+        self.var, time_dim = get_cube_var(var, accum_h)
+        self.dates = get_cube_dates(nc_pool.get(file_cube), time_dim)
+        self.dates_set = set(self.dates)
+
+    def get(self, date):
+        # file holding the obs at date (None if not found)
+        if date in self.dates_set:
+            return self.filename
+        return None
+
+    def __contains__(self, date):
+        return date in self.dates_set
+
+    def gaps(self, dates):
+        return [date for date in dates if date not in self]
+
+    def coverage(self, dates):
+        dates = list(dates)
+        if len(dates) == 0:
+            return 0.
+        return 1. - len(self.gaps(dates)) / len(dates)
+
+    def read_field(self, date, fileformat, vars = [], window = None):
+        # fileformat and the name of vars are those of the obs files
+        vars_cube = [self.var for _ in check_is_typelist(vars)]
+        return read_field(self.filename, 'netCDF', vars_cube, date, window)
+
+
+def get_obs_source(obs_templates, obs, case, relative_indexed_path, var, accum_h):
+    # case cube if it is enabled and holds var, obs files otherwise
+    file_cube = get_cube_filename(obs, case, relative_indexed_path)
+    if get_runtime_settings()['obs_cube']['enabled'] and os.path.isfile(file_cube):
+        if get_cube_var(var, accum_h)[0] in nc_pool.get(file_cube).data_vars:
+            print(f"INFO: obs read from the case cube '{file_cube}'")
+            return ObsCube(file_cube, var, accum_h)
+    return ObsInventory(obs_templates)
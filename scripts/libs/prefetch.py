@@ -0,0 +1,63 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from runtime import get_runtime_settings
+
+
+def get_nbytes(obj):
+    # memory held by the arrays of a result (arrays, fields, lists, dicts)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif isinstance(obj, (list, tuple)):
+        return sum(get_nbytes(item) for item in obj)
+    elif isinstance(obj, dict):
+        return sum(get_nbytes(item) for item in obj.values())
+    elif hasattr(obj, 'values'):
+        return get_nbytes(obj.values)
+    return 0
+
+
+class Prefetcher(object):
+    # iterates over (item, read_function(item)) in the order of items. The
+    # reads of the next lookahead items are done by background threads while
+    # the current one is processed; no more reads are started while the
+    # results waiting to be used take more than max_size (GB). With
+    # lookahead = 0 the reads are done when each item is requested
+    def __init__(self, items, read_function, lookahead = None, max_size = None):
+        settings = get_runtime_settings()['prefetch']
+        self.items = list(items)
+        self.read_function = read_function
+        self.lookahead = settings['lookahead'] if lookahead is None else lookahead
+        max_size = settings['max_size'] if max_size is None else max_size
+        self.max_bytes = int(float(max_size) * 1024**3)
+
+    def held_bytes(self, pending):
+        return sum(
+            get_nbytes(future.result()) for future in pending
+            if future.done() and future.exception() is None
+        )
+
+    def __iter__(self):
+        if self.lookahead <= 0:
+            for item in self.items:
+                yield item, self.read_function(item)
+            return
+        executor = ThreadPoolExecutor(max_workers=self.lookahead)
+        pending = deque()
+        next_item = 0
+        try:
+            for item in self.items:
+                while next_item < len(self.items) and (
+                    len(pending) == 0 or (
+                        len(pending) <= self.lookahead
+                        and self.held_bytes(pending) <= self.max_bytes
+                    )
+                ):
+                    pending.append(
+                        executor.submit(self.read_function, self.items[next_item])
+                    )
+                    next_item += 1
+                yield item, pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
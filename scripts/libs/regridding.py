@@ -0,0 +1,289 @@
+import os
+import hashlib
+import numpy as np
+import pyproj
+from scipy import sparse
+from scipy.spatial import Delaunay, cKDTree
+
+# interpolation operators are stored as sparse matrices (n_target x n_source)
+# and keyed by a hash of both grids, so that they can be shared between lead
+# times, inits and experiments with the same domain
+CACHE_DIR = 'cache/regrid'
+
+
+def grid_hash(*arrays):
+    sha = hashlib.sha1()
+    for array in arrays:
+        values = np.ascontiguousarray(array, dtype=np.float64)
+        sha.update(str(values.shape).encode())
+        sha.update(values.tobytes())
+    return sha.hexdigest()
+
+def text_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:8]
+
+def build_sparse_operator(rows, cols, weights, n_target, n_source, valid):
+    # target points without source values are set to NaN by means of a single
+    # NaN weight, so the operator reproduces the fill value of griddata
+    id_nan = np.flatnonzero(~valid)
+    operator = sparse.coo_matrix(
+        (
+            np.concatenate((weights, np.full(id_nan.size, np.nan))),
+            (
+                np.concatenate((rows, id_nan)),
+                np.concatenate((cols, np.zeros(id_nan.size, dtype=int)))
+            )
+        ),
+        shape=(n_target, n_source)
+    )
+    return operator.tocsr()
+
+def linear_weights(src_lat, src_lon, dst_lat, dst_lon):
+    # barycentric weights of the Delaunay triangulation built by
+    # scipy.interpolate.griddata(..., method='linear')
+    print('INFO:regridding:triangulating source grid')
+    points = np.column_stack((src_lon.ravel(), src_lat.ravel()))
+    xi = np.column_stack((dst_lon.ravel(), dst_lat.ravel()))
+    tri = Delaunay(points)
+    simplex = tri.find_simplex(xi)
+    inside = simplex >= 0
+    transform = tri.transform[simplex[inside]]
+    bary = np.einsum(
+        'ijk,ik->ij', transform[:, :2, :], xi[inside] - transform[:, 2, :]
+    )
+    weights = np.column_stack((bary, 1. - bary.sum(axis=1)))
+    rows = np.repeat(np.flatnonzero(inside), 3)
+    cols = tri.simplices[simplex[inside]].ravel()
+    return build_sparse_operator(
+        rows, cols, weights.ravel(), xi.shape[0], points.shape[0], inside
+    )
+
+def lonlat_to_xyz(lat, lon):
+    # unit-sphere cartesian coordinates: distances have no pole/dateline issues
+    lat_rad = np.deg2rad(np.ravel(lat))
+    lon_rad = np.deg2rad(np.ravel(lon))
+    return np.column_stack((
+        np.cos(lat_rad) * np.cos(lon_rad),
+        np.cos(lat_rad) * np.sin(lon_rad),
+        np.sin(lat_rad)
+    ))
+
+def get_grid_spacing(tree, points, n_sample=10000):
+    # median distance between neighbouring points of the tree
+    step = max(1, points.shape[0] // n_sample)
+    dist, _ = tree.query(points[::step], k=2)
+    return np.median(dist[:, 1])
+
+def idw_weights(
+        src_lat, src_lon, dst_lat, dst_lon, neighbours=4, power=2.
+    ):
+    # inverse distance weighting of the k nearest source points. Target points
+    # farther than 1.5 times the source grid spacing are outside the domain
+    print('INFO:regridding:building KD-tree of source grid')
+    src_xyz = lonlat_to_xyz(src_lat, src_lon)
+    dst_xyz = lonlat_to_xyz(dst_lat, dst_lon)
+    tree = cKDTree(src_xyz)
+    max_dist = 1.5 * get_grid_spacing(tree, src_xyz)
+    dist, ids = tree.query(
+        dst_xyz, k=neighbours, distance_upper_bound=max_dist
+    )
+    dist = dist.reshape(dst_xyz.shape[0], neighbours)
+    ids = ids.reshape(dst_xyz.shape[0], neighbours)
+    found = np.isfinite(dist)
+    valid = found[:, 0]
+    with np.errstate(divide='ignore'):
+        weights = np.where(found, 1. / dist ** power, 0.)
+    # exact matches take all the weight
+    exact = dist[:, 0] == 0.
+    weights[exact] = 0.
+    weights[exact, 0] = 1.
+    weights[valid] /= weights[valid].sum(axis=1, keepdims=True)
+    rows = np.repeat(np.arange(dst_xyz.shape[0]), neighbours)
+    keep = found.ravel() & (weights.ravel() > 0.)
+    return build_sparse_operator(
+        rows[keep], ids.ravel()[keep], weights.ravel()[keep],
+        dst_xyz.shape[0], src_xyz.shape[0], valid
+    )
+
+def nearest_weights(src_lat, src_lon, dst_lat, dst_lon):
+    return idw_weights(src_lat, src_lon, dst_lat, dst_lon, neighbours=1)
+
+def upscale_weights(src_lat, src_lon, dst_lat, dst_lon):
+    # block average (fine-to-coarse): each source point is assigned to the
+    # target cell with the closest centre and the target value is the mean of
+    # its source points. Target cells without any source point (e.g. where
+    # the target grid is finer) take the value of the nearest source point
+    print('INFO:regridding:assigning source points to target cells')
+    src_xyz = lonlat_to_xyz(src_lat, src_lon)
+    dst_xyz = lonlat_to_xyz(dst_lat, dst_lon)
+    n_target = dst_xyz.shape[0]
+    dst_tree = cKDTree(dst_xyz)
+    max_dist = get_grid_spacing(dst_tree, dst_xyz)
+    dist, id_target = dst_tree.query(src_xyz, distance_upper_bound=max_dist)
+    inside = np.isfinite(dist)
+    rows = id_target[inside]
+    cols = np.flatnonzero(inside)
+    counts = np.bincount(rows, minlength=n_target)
+    weights = 1. / counts[rows]
+    valid = counts > 0
+    if not valid.all():
+        src_tree = cKDTree(src_xyz)
+        max_dist_src = 1.5 * get_grid_spacing(src_tree, src_xyz)
+        id_empty = np.flatnonzero(~valid)
+        dist_empty, id_source = src_tree.query(
+            dst_xyz[id_empty], distance_upper_bound=max_dist_src
+        )
+        found = np.isfinite(dist_empty)
+        rows = np.concatenate((rows, id_empty[found]))
+        cols = np.concatenate((cols, id_source[found]))
+        weights = np.concatenate((weights, np.ones(found.sum())))
+        valid[id_empty[found]] = True
+    return build_sparse_operator(
+        rows, cols, weights, n_target, src_xyz.shape[0], valid
+    )
+
+def project_grid(projection, lat, lon):
+    proj = pyproj.Proj(projection)
+    x, y = proj(lon, lat)
+    return np.asarray(x), np.asarray(y)
+
+def get_regular_axes(x, y, rtol=0.01):
+    # axes of a grid which is regular in its native projection (x only
+    # varying along columns, y along rows, constant spacing); None otherwise
+    if x.ndim != 2 or min(x.shape) < 2:
+        return None
+    x_axis = x[0, :]
+    y_axis = y[:, 0]
+    dx = (x_axis[-1] - x_axis[0]) / (x_axis.size - 1)
+    dy = (y_axis[-1] - y_axis[0]) / (y_axis.size - 1)
+    tol_x = rtol * abs(dx)
+    tol_y = rtol * abs(dy)
+    is_regular = (
+        (tol_x > 0.) and (tol_y > 0.)
+        and np.abs(x - x_axis[np.newaxis, :]).max() <= tol_x
+        and np.abs(y - y_axis[:, np.newaxis]).max() <= tol_y
+        and np.abs(np.diff(x_axis) - dx).max() <= tol_x
+        and np.abs(np.diff(y_axis) - dy).max() <= tol_y
+    )
+    if is_regular:
+        return x_axis[0], dx, y_axis[0], dy
+    else:
+        return None
+
+def structured_weights(
+        src_lat, src_lon, dst_lat, dst_lon, projection, method='linear'
+    ):
+    # index arithmetic on a source grid which is regular in its projection:
+    # target points are projected once and located by fractional indices
+    src_x, src_y = project_grid(projection, src_lat, src_lon)
+    axes = get_regular_axes(src_x, src_y)
+    if axes is None:
+        print(
+            'INFO:regridding:source grid is not regular in projection '
+            f'"{projection}". Using unstructured {method} weights'
+        )
+        return regrid_weights_function[method](
+            src_lat, src_lon, dst_lat, dst_lon
+        )
+    print(f'INFO:regridding:source grid regular in projection "{projection}"')
+    x_0, dx, y_0, dy = axes
+    n_y, n_x = src_lat.shape
+    dst_x, dst_y = project_grid(projection, dst_lat.ravel(), dst_lon.ravel())
+    frac_i = (dst_x - x_0) / dx
+    frac_j = (dst_y - y_0) / dy
+    valid = (
+        (frac_i >= 0.) & (frac_i <= n_x - 1.)
+        & (frac_j >= 0.) & (frac_j <= n_y - 1.)
+    )
+    rows = np.flatnonzero(valid)
+    frac_i = frac_i[valid]
+    frac_j = frac_j[valid]
+    if method == 'nearest':
+        cols = np.rint(frac_j).astype(int) * n_x + np.rint(frac_i).astype(int)
+        weights = np.ones(rows.size)
+    elif method == 'linear':
+        # bilinear interpolation from the 4 surrounding grid points
+        id_i = np.minimum(np.floor(frac_i).astype(int), n_x - 2)
+        id_j = np.minimum(np.floor(frac_j).astype(int), n_y - 2)
+        t_i = frac_i - id_i
+        t_j = frac_j - id_j
+        cols = np.column_stack((
+            id_j * n_x + id_i,
+            id_j * n_x + id_i + 1,
+            (id_j + 1) * n_x + id_i,
+            (id_j + 1) * n_x + id_i + 1
+        )).ravel()
+        weights = np.column_stack((
+            (1. - t_i) * (1. - t_j),
+            t_i * (1. - t_j),
+            (1. - t_i) * t_j,
+            t_i * t_j
+        )).ravel()
+        rows = np.repeat(rows, 4)
+    else:
+        raise ValueError(
+            f'method not available for structured grids: {method}'
+        )
+    return build_sparse_operator(
+        rows, cols, weights, dst_lat.size, src_lat.size, valid
+    )
+
+structured_methods = ('linear', 'nearest')
+
+regrid_weights_function = {
+    'linear': linear_weights,
+    'nearest': nearest_weights,
+    'idw': idw_weights,
+    'upscale': upscale_weights
+}
+
+def get_regrid_operator(
+        src_lat, src_lon, dst_lat, dst_lon, method='linear', projection=None,
+        options=None, cache_dir=CACHE_DIR
+    ):
+    # if the projection of the source grid is known, the structured fast path
+    # is used (it falls back to the unstructured weights if the grid is not
+    # regular). options are extra arguments of the weights function
+    if options is None:
+        options = {}
+    if method not in structured_methods:
+        projection = None
+    key = grid_hash(src_lat, src_lon, dst_lat, dst_lon)
+    if projection is None:
+        kind = method
+        if len(options) > 0:
+            key += text_hash(str(sorted(options.items())))
+    else:
+        kind = f'structured_{method}'
+        key += text_hash(projection)
+    file_operator = os.path.join(cache_dir, f'{kind}_{key}.npz')
+    if os.path.isfile(file_operator):
+        print(f'INFO:regridding:loading {kind} weights from {file_operator}')
+        return sparse.load_npz(file_operator)
+    print(f'INFO:regridding:computing {kind} weights')
+    if projection is None:
+        operator = regrid_weights_function[method](
+            src_lat, src_lon, dst_lat, dst_lon, **options
+        )
+    else:
+        operator = structured_weights(
+            src_lat, src_lon, dst_lat, dst_lon, projection, method
+        )
+    # write to a temporary file first: several runs may share the same cache
+    os.makedirs(cache_dir, exist_ok=True)
+    file_tmp = os.path.join(cache_dir, f'.{kind}_{key}_{os.getpid()}.npz')
+    sparse.save_npz(file_tmp, operator)
+    os.replace(file_tmp, file_operator)
+    print(f'INFO:regridding:weights saved in {file_operator}')
+    return operator
+
+def apply_operator(operator, values, target_shape):
+    # values of shape (..., ny_source, nx_source); all the leading dimensions
+    # (e.g. lead times) are regridded with a single sparse matrix product
+    # (accumulated in the dtype of the weights, returned in that of values)
+    values = np.asarray(values)
+    stack = values.reshape(-1, operator.shape[1])
+    regridded = operator.dot(stack.T).T
+    if np.issubdtype(values.dtype, np.floating):
+        regridded = regridded.astype(values.dtype, copy=False)
+    return regridded.reshape(values.shape[:-2] + tuple(target_shape))
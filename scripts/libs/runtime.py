@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import yaml
+
+# settings of the run shared by all the scripts (config/config_runtime.yaml,
+# optional: default values are used for the missing keys)
+CONFIG_FILE = 'config/config_runtime.yaml'
+DEFAULT_SETTINGS = {
+    'dtype': 'float32',
+    'max_open_nc': 32,
+    'nc_profile': 'default',
+    'prefetch': {'lookahead': 2, 'max_size': 2.},
+    'field_store': {'enabled': True, 'path': 'cache/fields', 'max_size': 10.},
+    'obs_cube': {'enabled': False, 'halo': 5.}
+}
+
+runtime_settings = None
+
+def get_runtime_settings():
+    global runtime_settings
+    if runtime_settings is None:
+        config_runtime = {}
+        if os.path.isfile(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as stream:
+                config_runtime = yaml.safe_load(stream) or {}
+        runtime_settings = {
+            'dtype': config_runtime.get('dtype', DEFAULT_SETTINGS['dtype']),
+            'max_open_nc': config_runtime.get('max_open_nc', DEFAULT_SETTINGS['max_open_nc']),
+            'nc_profile': config_runtime.get('nc_profile', DEFAULT_SETTINGS['nc_profile']),
+            'prefetch': dict(
+                DEFAULT_SETTINGS['prefetch'],
+                **(config_runtime.get('prefetch') or {})
+            ),
+            'field_store': dict(
+                DEFAULT_SETTINGS['field_store'],
+                **(config_runtime.get('field_store') or {})
+            ),
+            'obs_cube': dict(
+                DEFAULT_SETTINGS['obs_cube'],
+                **(config_runtime.get('obs_cube') or {})
+            )
+        }
+    return runtime_settings
+
+def get_working_dtype():
+    # dtype of the fields read and processed (coordinates are kept in
+    # float64, and sums are accumulated in float64)
+    return np.dtype(get_runtime_settings()['dtype'])
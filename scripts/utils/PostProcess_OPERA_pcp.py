@@ -6,7 +6,7 @@ import pyproj
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from LoadWriteData import LoadConfigFileFromYaml, build_dataset
+from LoadWriteData import LoadConfigFileFromYaml, build_dataset, write_dataset
 
 obs = "OPERA_rain"
 obs_filename_raw = "T_PASH22_C_EUOC_%Y%m%d%H%M%S.hdf"#old: 'ODC.LAM_%Y%m%d%H%M_000100.h5'
@@ -101,10 +101,7 @@ def main(path_OPERA_raw, case):
         )
         file_new = datetime.strftime(date, f'{obs_path}{obs_filename}')
         print(f'INFO:saving processed values in {file_new}')
-        ds.to_netcdf(
-            file_new,
-            encoding={"time": {"units": "seconds since 1970-01-01"}}
-        )
+        write_dataset(ds, file_new)
     return 0
 
 if __name__ == '__main__':
@@ -6,7 +6,7 @@ import pyproj
 import numpy as np
 import pandas as pd
 from datetime import datetime
-from LoadWriteData import LoadConfigFileFromYaml, BuildXarrayDataset
+from LoadWriteData import LoadConfigFileFromYaml, build_dataset, write_dataset
 
 obs = 'OPERA_refl'
 obs_filename_raw = 'ODC.REF_%Y%m%d%H%M.h5'
@@ -86,10 +86,20 @@ def main(path_OPERA_raw, case):
         file_obs = datetime.strftime(date, f'{path_OPERA_raw}{obs_filename_raw}')
         values = get_vars_from_OPERA(file_obs, [obs_var_get,])
         lat_obs, lon_obs = get_latlon2D_from_OPERA(file_obs)
-        ds = BuildXarrayDataset(np.flip(values, axis = 0), lon_obs, lat_obs, date, varName = var_verif, lonName = 'lon', latName = 'lat', descriptionNc = f'OPERA | maximun reflectivity (dBZ) | {datetime.strftime(date, "%Y%m%d%H")}')
+        ds = build_dataset(
+            np.flip(values, axis = 0),
+            date,
+            lat_obs,
+            lon_obs,
+            var_verif,
+            attrs_var={
+                "units": "dBZ",
+                "long_name": f'OPERA | maximun reflectivity (dBZ) | {datetime.strftime(date, "%Y%m%d%H")}'
+            }
+        )
         file_new = datetime.strftime(date, f'{obs_path}{obs_filename}')
         print(f'INFO:saving processed values in {file_new}')
-        ds.to_netcdf(file_new, compute='True')
+        write_dataset(ds, file_new)
     return 0
 
 if __name__ == '__main__':
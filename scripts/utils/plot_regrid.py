@@ -6,8 +6,10 @@ import sys
 
 sys.path.append('scripts/libs/')
 from namingformatter import NamingFormatter
-from LoadWriteData import LoadConfigFileFromYaml
-from dicts import get_data_function, get_grid_function, colormaps
+from LoadWriteData import LoadConfigFileFromYaml, read_field, TimeSeriesNC
+from inputcatalog import get_obs_file_info, get_obs_templates
+from obscube import get_obs_source
+from dicts import colormaps
 from times import set_lead_times, lead_time_replace
 from domains import set_domain_verif
 from plots import PlotMapInAxis, plot_verif_domain_in_axis
@@ -24,8 +26,6 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     config_obs_db = LoadConfigFileFromYaml(
         f"config/obs_db/config_{obs_db}.yaml"
     )
-    obs_filename = config_obs_db['format']['filename'][var_verif]
-    obs_fileformat = config_obs_db['format']['fileformat']
     if config_obs_db['vars'][var_verif]['postprocess']:
         obs_var_get = var_verif
     else:
@@ -34,10 +34,9 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     var_verif_units = config_obs_db['vars'][var_verif]['units']
     accum_h = config_obs_db["vars"][var_verif]["verif"]["times"]["accum_hours"]
     freq_verif = config_obs_db["vars"][var_verif]["verif"]["times"]["freq_verif"]
-    # update params if accumulated values
+    # update params if accumulated (or aggregated) values
+    obs_filename, obs_fileformat = get_obs_file_info(config_obs_db, var_verif, accum_h)
     if accum_h > 1:
-        obs_filename = f"acc{accum_h}h_{'.'.join(obs_filename.split('.')[:-1])}.nc"
-        obs_fileformat = "netCDF"
         var_verif_description = var_verif_description.replace(
             "1-hour", f"{accum_h}-hour"
         )
@@ -78,6 +77,14 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     # naming formatter
     formatter = NamingFormatter(obs, case, exp, relative_indexed_path)
 
+    # input files of obs
+    obs_inventory = get_obs_source(
+        get_obs_templates(
+            config_obs_db, obs, relative_indexed_path, case, obs_filename
+        ),
+        obs, case, relative_indexed_path, obs_var_get, accum_h
+    )
+
     # replace outputs bool
     repl_outputs = str2bool(replace_bool)
 
@@ -112,7 +119,14 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
                 f"with frequency: {freq_verif}h"
             )
 
-            # plot OBS vs Regrid exp at each timestep
+            # plot OBS vs Regrid exp at each timestep (regridded files of
+            # the init as a single time series)
+            nwp_series = TimeSeriesNC({
+                date_simus_ini + timedelta(hours=lead_time.item()): formatter.format_regrid(
+                    init_time=init_time, lead_time=lead_time.item(), acc_h=accum_h
+                )
+                for lead_time in lead_times
+            })
             for lead_time in lead_times:
                 fig_name = formatter.format_string(
                     template="plot_regrid",
@@ -121,26 +135,24 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
                     acc_h=accum_h
                 )
                 if not os.path.isfile(fig_name) or repl_outputs:
-                    obs_file = datetime.strftime(
-                        date_simus_ini + timedelta(hours=lead_time.item()),
-                        f"OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}/{obs_filename}"
+                    obs_file = obs_inventory.get(
+                        date_simus_ini + timedelta(hours=lead_time.item())
                     )
-                    file_nwp = formatter.format_string(
-                        template="regrid",
+                    file_nwp = formatter.format_regrid(
                         init_time=init_time,
                         lead_time=lead_time.item(),
                         acc_h=accum_h
                     )
-                    if os.path.isfile(obs_file) and os.path.isfile(file_nwp):
-                        data_obs = get_data_function[obs_fileformat](
-                            obs_file, obs_var_get
-                        )
-                        lat_obs, lon_obs = get_grid_function[obs_fileformat](
-                            obs_file
-                        )
-                        data_nwp, lat_nwp, lon_nwp = get_data_function['netCDF'](
-                            file_nwp, [var_verif, 'lat', 'lon']
+                    valid_time = date_simus_ini + timedelta(hours=lead_time.item())
+                    if obs_file is not None and valid_time in nwp_series:
+                        field_obs = obs_inventory.read_field(
+                            valid_time, obs_fileformat, obs_var_get
                         )
+                        data_obs = field_obs.data
+                        lat_obs, lon_obs = field_obs.grid
+                        field_nwp = nwp_series.read_field(var_verif, valid_time)
+                        data_nwp = field_nwp.data
+                        lat_nwp, lon_nwp = field_nwp.grid
             
                         # set verif domain
                         verif_domain = set_domain_verif(
@@ -162,7 +174,6 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
 
                         # plot large and small domain in different figs
                         print(f"INFO: Plotting '{obs_file}' vs '{file_nwp}'")
-                        valid_time = date_simus_ini + timedelta(hours=lead_time.item())
                         fig = plt.figure(
                             0,
                             figsize=(20.0 / 2.54, 11.0 / 2.54),
@@ -9,9 +9,11 @@ from glob import glob
 
 sys.path.append('scripts/libs/')
 from namingformatter import NamingFormatter
-from LoadWriteData import LoadConfigFileFromYaml, LoadPickle
-from dicts import get_data_function, get_grid_function, postprocess_function, colormaps
-from times import lead_time_replace, set_lead_times
+from inputcatalog import InputCatalog, get_obs_file_info, get_obs_templates, get_exp_templates
+from obscube import get_obs_source
+from LoadWriteData import LoadConfigFileFromYaml, read_field, LoadPickle
+from dicts import postprocess_function, colormaps
+from times import set_lead_times
 from domains import set_domain_verif
 from miscelanea import list_sorted_files
 from plots import PlotMapInAxis, plot_verif_domain_in_axis, plot_domain_in_axis
@@ -33,8 +35,8 @@ def main(obs, case, exps, relative_indexed_path):
     config_obs_db = LoadConfigFileFromYaml(
         f"config/obs_db/config_{obs_db}.yaml"
     )
-    obs_filename = config_obs_db['format']['filename'][var_verif]
-    obs_fileformat = config_obs_db['format']['fileformat']
+    # hourly values
+    obs_filename, obs_fileformat = get_obs_file_info(config_obs_db, var_verif, 1)
     if config_obs_db['vars'][var_verif]['postprocess']:
         obs_var_get = var_verif
     else:
@@ -72,6 +74,16 @@ def main(obs, case, exps, relative_indexed_path):
     # naming formatters
     formatter = {}
 
+    # input files of obs and exps
+    catalog = InputCatalog()
+    # (hourly obs)
+    obs_inventory = get_obs_source(
+        get_obs_templates(
+            config_obs_db, obs, relative_indexed_path, case, obs_filename
+        ),
+        obs, case, relative_indexed_path, obs_var_get, 1
+    )
+
     # Experiments to compare between. Load fss to set common init times
     configs_exps, lead_times_inits_exps, date_exps_end = {}, {}, {}
     expLowRes, expHighRes = exps.split('-VS-')
@@ -150,57 +162,40 @@ def main(obs, case, exps, relative_indexed_path):
             values_obs = []
             values_exp_highres = []
             obs_lat = None
-            expLowRes_lat = None
-            expHighRes_lat = None
+            exp_grids = {}
             for lead_time in lead_times:
                 valid_time = date_exp_ini + timedelta(hours=lead_time.item())
                 valid_times.append(valid_time)
                 # name of files
-                obs_file = datetime.strftime(
-                    valid_time,
-                    f'OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}/{obs_filename}'
+                obs_file = obs_inventory.get(valid_time)
+                exp_lowres_file = catalog.resolve(
+                    get_exp_templates(
+                        configs_exps[expLowRes], expLowRes, init_time,
+                        relative_indexed_path
+                    ),
+                    date_exp_ini,
+                    lead_time.item()
                 )
-                exp_lowres_file = date_exp_ini.strftime(
-                    os.path.join(
-                        f"SIMULATIONS/{relative_indexed_path}/{expLowRes}/data_orig/{init_time}",
-                        lead_time_replace(
-                            configs_exps[expLowRes]['format']['filename'],
-                            lead_time.item()
-                        )
-                    )
-                )
-                exp_highres_file = date_exp_ini.strftime(
-                    os.path.join(
-                        f"SIMULATIONS/{relative_indexed_path}/{expHighRes}/data_orig/{init_time}",
-                        lead_time_replace(
-                            configs_exps[expHighRes]['format']['filename'],
-                            lead_time.item()
-                        )
-                    )
+                exp_highres_file = catalog.resolve(
+                    get_exp_templates(
+                        configs_exps[expHighRes], expHighRes, init_time,
+                        relative_indexed_path
+                    ),
+                    date_exp_ini,
+                    lead_time.item()
                 )
 
-                # get lat lon coordinates from obs and exps
-                if obs_lat is None and os.path.isfile(obs_file):
-                    obs_lat, obs_lon = get_grid_function[obs_fileformat](obs_file)
-                if expLowRes_lat is None and os.path.isfile(exp_lowres_file):
-                    expLowRes_lat, expLowRes_lon = get_grid_function[configs_exps[expLowRes]['format']['fileformat']](
-                        exp_lowres_file
+                # append values (lat lon coordinates from the first file
+                # read of obs and exps)
+                if obs_file is not None:
+                    field_obs = obs_inventory.read_field(
+                        valid_time, obs_fileformat, obs_var_get
                     )
-                if expHighRes_lat is None and os.path.isfile(exp_highres_file):
-                    expHighRes_lat, expHighRes_lon = get_grid_function[configs_exps[expHighRes]['format']['fileformat']](
-                        exp_highres_file
-                    )
-
-                # append values
-                try:
-                    values_obs.append(
-                        get_data_function[obs_fileformat](
-                            obs_file,
-                            obs_var_get
-                        )
-                    )
-                except FileNotFoundError:
-                    print(f"INFO: file '{obs_file}' not found.")
+                    if obs_lat is None:
+                        obs_lat, obs_lon = field_obs.grid
+                    values_obs.append(field_obs.data)
+                else:
+                    print(f"INFO: obs file at {valid_time} not found.")
                     plot_fig = False
                 combined_lists = zip(
                     (expLowRes, expHighRes),
@@ -215,23 +210,33 @@ def main(obs, case, exps, relative_indexed_path):
                                 configs_exps[exp]['vars'][var_verif]['verif_0h']
                             )
                     ):
-                        try:
-                            values = get_data_function[configs_exps[exp]['format']['fileformat']](
+                        if filename is not None:
+                            field_exp = read_field(
                                 filename,
+                                configs_exps[exp]['format']['fileformat'],
                                 configs_exps[exp]['vars'][var_verif]['var']
                             )
+                            if exp not in exp_grids:
+                                exp_grids[exp] = field_exp.grid
+                            values = field_exp.data
                             # check if values must be processed
                             if configs_exps[exp]['vars'][var_verif]['postprocess'] != "None":
                                 values_pp = postprocess_function[configs_exps[exp]['vars'][var_verif]['postprocess']](
                                     values
                                 )
                             else:
-                                values_pp = values.copy()
-                            list_values.append(values_pp.copy())
-                        except OSError:
-                            print(f"INFO: file '{filename}' not found.")
+                                values_pp = values
+                            list_values.append(values_pp)
+                        else:
+                            print(
+                                f"INFO: file of {exp} at {init_time}+"
+                                f"{str(lead_time.item()).zfill(2)} not found."
+                            )
                             plot_fig = False
 
+            expLowRes_lat, expLowRes_lon = exp_grids.get(expLowRes, (None, None))
+            expHighRes_lat, expHighRes_lon = exp_grids.get(expHighRes, (None, None))
+
             # plotting
             if plot_fig:
                 fig = plt.figure(
@@ -267,12 +272,12 @@ def main(obs, case, exps, relative_indexed_path):
                         )
                     if ((var_verif == 'pcp') | (var_verif == 'rain')):
                         if db == obs_db:
-                            values_to_plot = np.nansum(values[1:], axis = 0)
+                            values_to_plot = np.nansum(values[1:], axis = 0, dtype = np.float64)
                         else:
                             if lead_time_ini.item() == 0:
-                                values_to_plot = values[-1].copy()
+                                values_to_plot = values[-1]
                             else:
-                                values_to_plot = values[-1].copy() - values[0].copy()
+                                values_to_plot = values[-1] - values[0]
                                 values_to_plot[values_to_plot < 0.] = 0.
                         n_hours = (lead_time_end - lead_time_ini).item()
                         cb_label = (
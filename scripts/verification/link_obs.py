@@ -3,14 +3,21 @@ import os
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
+from functools import partial
+from multiprocessing import Pool
 
 sys.path.append("scripts/libs/")
-from miscelanea import check_is_empty_dir
-from LoadWriteData import LoadConfigFileFromYaml, build_dataset
-from dicts import get_data_function, get_grid_function
+from LoadWriteData import LoadConfigFileFromYaml, read_field, build_dataset, write_dataset, nc_pool
+from inputcatalog import InputCatalog, ObsInventory, get_obs_file_info, get_obs_templates
+from aggregation import AGGREGATIONS, get_subhourly_dates, write_hourly_obs
+from accumulation import accumulate_windows
+from prefetch import Prefetcher
+from obscube import get_cube_filename, build_obs_cube
+from domains import ExpandBounds, get_crop_indices, CropDomainsFromIndices
+from runtime import get_runtime_settings
 
 
-def main(obs, case, relative_indexed_path):
+def main(obs, case, relative_indexed_path, workers=1):
     print("INFO: RUNNING LINK OBS")
     # OBS data: database + variable
     obs_db, var_verif = obs.split("_")
@@ -24,6 +31,7 @@ def main(obs, case, relative_indexed_path):
     obs_path_destin = f"OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}"
     obs_filename = config_obs_db["format"]["filename"][var_verif]
     obs_fileformat = config_obs_db['format']['fileformat']
+    obs_link = config_obs_db['format'].get('link', False)
     if config_obs_db['vars'][var_verif]['postprocess']:
         obs_var_get = var_verif
     else:
@@ -32,12 +40,25 @@ def main(obs, case, relative_indexed_path):
     var_verif_units = config_obs_db['vars'][var_verif]['units']
     accum_h = config_obs_db["vars"][var_verif]["verif"]["times"]["accum_hours"]
     freq_verif = config_obs_db["vars"][var_verif]["verif"]["times"]["freq_verif"]
+    # sub-hourly files (optional): aggregated into hourly values
+    subhourly = config_obs_db['vars'][var_verif].get('subhourly')
+    if subhourly:
+        subhourly_aggregation = subhourly.get('aggregation', 'sum')
+        subhourly_label = subhourly.get('label', 'end')
+        if subhourly_aggregation not in AGGREGATIONS:
+            raise ValueError(
+                f"unknown aggregation: {subhourly_aggregation}. Options: {AGGREGATIONS}"
+            )
     print(
         f"INFO: Loaded config file for {obs_db} database:\n "
         + f"obs downloaded at: {obs_path};\n file name: {obs_filename};\n "
         + f"file format: {obs_fileformat};\n "
         + f"hours between verif timesteps: {freq_verif};\n "
         + f"values accumulated in {accum_h} hours (0: inst.)"
+        + (
+            f";\n {subhourly_aggregation} of files every {subhourly['freq_minutes']} minutes"
+            if subhourly else ""
+        )
     )
 
     # Case data: initial date + end date
@@ -51,57 +72,161 @@ def main(obs, case, relative_indexed_path):
         + f"end: {config_case['dates']['end']}"
     )
 
+    # input files of obs
+    catalog = InputCatalog()
+    obs_templates = get_obs_templates(
+        config_obs_db, obs, relative_indexed_path, case, obs_filename
+    )
+    obs_inventory = ObsInventory(obs_templates)
+
     # dates to verify
     dates_to_verif = pd.date_range(
         date_ini,
         date_end,
         freq=f"{freq_verif}h"
     ).to_pydatetime()
+    # hours of each accumulation period
+    # assume that each obs file contains hourly acc. values (or sub-hourly
+    # files to be aggregated into hourly values)
+    hours_verif = set()
     for date_verif in dates_to_verif:
-        # dates of each accumulation period
-        # assume that each obs file contains hourly acc. values
-        files_acc = []
         date_prev = date_verif - timedelta(hours=accum_h - 1)
-        dates = pd.date_range(date_prev, date_verif, freq="1h").to_pydatetime()
-        for date in dates:
-            # link files
-            obs_destin = date.strftime(
-                os.path.join(obs_path_destin, obs_filename)
-            )
-            if not os.path.isfile(obs_destin):
-                obs_origin = date.strftime(os.path.join(obs_path, obs_filename))
-                if os.path.isfile(obs_origin):
-                    os.system(f"ln -s {obs_origin} {obs_destin}")
-                    print(f"INFO: link {obs_destin} --> {obs_origin} created")
-                    files_acc.append(obs_destin)
-                else:
-                    print(f"INFO: file {obs_origin} not downloaded")
-            else:
-                print(f"INFO: file {obs_destin} exists")
-                files_acc.append(obs_destin)
-        # compute accumulations
-        file_accum = date_verif.strftime(
-            os.path.join(
-                obs_path_destin,
-                f"acc{accum_h}h_{'.'.join(obs_filename.split('.')[:-1])}.nc"
+        hours_verif.update(pd.date_range(date_prev, date_verif, freq="1h").to_pydatetime())
+    hours_verif = sorted(hours_verif)
+
+    # accumulations (and those not computed yet)
+    files_accum_all = {}
+    if accum_h > 1:
+        for date_verif in dates_to_verif:
+            files_accum_all[date_verif] = date_verif.strftime(
+                os.path.join(
+                    obs_path_destin,
+                    f"acc{accum_h}h_{'.'.join(obs_filename.split('.')[:-1])}.nc"
+                )
             )
+    files_accum = {
+        (accum_h, date_verif): file_accum
+        for date_verif, file_accum in files_accum_all.items()
+        if not catalog.exists(file_accum)
+    }
+    hours_needed = set()
+    for _, date_verif in files_accum.keys():
+        hours_needed.update(
+            date_verif - timedelta(hours=hour) for hour in range(accum_h)
         )
-        if (
-            not os.path.isfile(file_accum)
-            and accum_h > 1
-            and len(files_acc) == accum_h
+    cube_settings = get_runtime_settings()['obs_cube']
+
+    files_obs = {}
+    if subhourly:
+        # hourly values aggregated from the sub-hourly files (saved in the
+        # case folder, so each hour is aggregated once)
+        # only the hours of the accumulations not computed yet are aggregated,
+        # unless the hourly values are verified (accum_h = 1) or stacked in
+        # the case cube
+        hourly_filename, hourly_fileformat = get_obs_file_info(config_obs_db, var_verif, 1)
+        if accum_h > 1 and not cube_settings['enabled']:
+            hours_aggregate = hours_needed
+        else:
+            hours_aggregate = set(hours_verif)
+        tasks = []
+        for date in hours_verif:
+            file_hourly = date.strftime(os.path.join(obs_path_destin, hourly_filename))
+            if catalog.exists(file_hourly):
+                files_obs[date] = file_hourly
+                continue
+            if date not in hours_aggregate:
+                continue
+            files_subhourly = [
+                obs_inventory.get(date_subhourly)
+                for date_subhourly in get_subhourly_dates(
+                    date, subhourly['freq_minutes'], subhourly_label
+                )
+            ]
+            if None in files_subhourly:
+                print(
+                    f"INFO: {files_subhourly.count(None)} of {len(files_subhourly)} "
+                    f"sub-hourly files of {date.strftime('%Y%m%d%H')} not downloaded"
+                )
+                continue
+            tasks.append((date, files_subhourly, file_hourly))
+        print(
+            f"INFO: aggregating {len(tasks)} hours ({subhourly_aggregation} of "
+            f"sub-hourly files) with {workers} worker(s)"
+        )
+        os.makedirs(obs_path_destin, exist_ok=True)
+        write_function = partial(
+            write_hourly_obs,
+            fileformat=obs_fileformat,
+            var=obs_var_get,
+            aggregation=subhourly_aggregation,
+            attrs_var={'units': var_verif_units, 'long_name': var_verif_description}
+        )
+        # independent hours are aggregated in parallel
+        if workers > 1 and len(tasks) > 1:
+            nc_pool.close_all()
+            with Pool(processes=workers) as pool:
+                files_hourly = pool.map(write_function, tasks)
+        else:
+            files_hourly = map(write_function, tasks)
+        for (date, _, _), file_hourly in zip(tasks, files_hourly):
+            files_obs[date] = file_hourly
+            catalog.add(file_hourly)
+    else:
+        hourly_fileformat = obs_fileformat
+        print(
+            f"INFO: obs found for {obs_inventory.coverage(hours_verif):.0%} "
+            f"of the {len(hours_verif)} hours of the case"
+        )
+        for date in hours_verif:
+            obs_file = obs_inventory.get(date)
+            if obs_file is None:
+                print(
+                    "INFO: file "
+                    f"{date.strftime(os.path.join(obs_path, obs_filename))} "
+                    "not downloaded"
+                )
+                continue
+            if obs_link:
+                # link files
+                obs_file = catalog.link(obs_file, obs_path_destin)
+            files_obs[date] = obs_file
+    n_files = len(files_obs)
+
+    # the hours are read once, in time order, and the accumulations are
+    # computed with running sums over the sliding windows. Only the case
+    # domain of the hourly fields is read and kept by the accumulator: NOzoom
+    # plus the margin of the NOzoom crop of regrid.py (5º) or the halo of the
+    # case cube if it is larger
+    accum_bounds = ExpandBounds(
+        config_case['location']['NOzoom'], max(5., float(cube_settings['halo']))
+    )
+    hours_read = sorted(hours_needed & files_obs.keys())
+    if len(files_accum) > 0 and len(hours_read) > 0:
+        obs_lat_orig, obs_lon_orig = read_field(files_obs[hours_read[0]], hourly_fileformat).grid
+        obs_window = get_crop_indices(obs_lat_orig, obs_lon_orig, accum_bounds)
+        obs_lat = CropDomainsFromIndices(obs_lat_orig, obs_window)
+        obs_lon = CropDomainsFromIndices(obs_lon_orig, obs_window)
+
+    def read_hour(date):
+        if date not in hours_needed or date not in files_obs:
+            return None
+        return read_field(
+            files_obs[date], hourly_fileformat, obs_var_get, window=obs_window
+        ).data
+
+    if len(files_accum) > 0 and len(hours_read) > 0:
+        hours = pd.date_range(
+            min(hours_needed), max(hours_needed), freq="1h"
+        ).to_pydatetime()
+        for accum_h_window, date_verif, acc_values in accumulate_windows(
+            Prefetcher(hours, read_hour), files_accum.keys()
         ):
             print(
                 "INFO: computing accumulated values: "
-                f"{datetime.strftime(date_prev - timedelta(hours=1), '%Y%m%d%H')}"
+                f"{datetime.strftime(date_verif - timedelta(hours=accum_h_window), '%Y%m%d%H')}"
                 f" - {date_verif.strftime('%Y%m%d%H')}"
             )
-            values_all = []
-            obs_lat, obs_lon = get_grid_function[obs_fileformat](files_acc[0])
-            for obs_file in files_acc:
-                values_file = get_data_function[obs_fileformat](obs_file, obs_var_get)
-                values_all.append(values_file)
-            acc_values = np.sum(values_all, axis=0)
+            file_accum = files_accum[(accum_h_window, date_verif)]
 
             # save file
             ds = build_dataset(
@@ -112,18 +237,48 @@ def main(obs, case, relative_indexed_path):
                 var_name=obs_var_get,
                 attrs_var={
                     'units': var_verif_units,
-                    'long_name': var_verif_description.replace("1-hour", f"{accum_h}-hour")
+                    'long_name': var_verif_description.replace("1-hour", f"{accum_h_window}-hour")
                 }
             )
-            ds.to_netcdf(
-                file_accum,
-                encoding={'time': {'units': 'seconds since 1970-01-01'}}
-            )
+            write_dataset(ds, file_accum)
+            catalog.add(file_accum)
             print(f"INFO: file '{file_accum}' saved")
 
-    if check_is_empty_dir(os.path.join(obs_path_destin, "*")):
-        raise ValueError(f"Error: '{obs_path_destin}' está vacío.")
+    # case cube: hourly and accumulated obs cropped to NOzoom (plus a halo)
+    # and stacked along time, read by the next steps
+    if cube_settings['enabled'] and n_files > 0:
+        products = {
+            1: (
+                hourly_fileformat, obs_var_get, files_obs,
+                {'units': var_verif_units, 'long_name': var_verif_description}
+            )
+        }
+        if accum_h > 1:
+            products[accum_h] = (
+                'netCDF', obs_var_get,
+                {
+                    date_verif: file_accum
+                    for date_verif, file_accum in files_accum_all.items()
+                    if catalog.exists(file_accum)
+                },
+                {
+                    'units': var_verif_units,
+                    'long_name': var_verif_description.replace("1-hour", f"{accum_h}-hour")
+                }
+            )
+        build_obs_cube(
+            get_cube_filename(obs, case, relative_indexed_path),
+            products,
+            ExpandBounds(config_case['location']['NOzoom'], float(cube_settings['halo']))
+        )
+
+    if n_files == 0:
+        raise ValueError(f"Error: obs not found in {obs_templates}.")
 
 
 if __name__ == "__main__":
-    main(str(sys.argv[1]), str(sys.argv[2]), str(sys.argv[3]))
+    if len(sys.argv) > 4:
+        n_workers = int(sys.argv[4])
+    else:
+        n_workers = 1
+    main(str(sys.argv[1]), str(sys.argv[2]), str(sys.argv[3]), n_workers)
@@ -1,46 +1,246 @@
 import os
 import numpy as np
+from collections import deque
+from multiprocessing import Pool
+from functools import partial
 import cartopy.crs as ccrs
 from datetime import datetime, timedelta
-from scipy.interpolate import griddata
 from matplotlib import pyplot as plt
 import sys
 
 sys.path.append('scripts/libs/')
 from namingformatter import NamingFormatter
-from miscelanea import check_is_empty_dir
-from LoadWriteData import LoadConfigFileFromYaml, build_dataset
-from times import set_lead_times, lead_time_replace
-from domains import CropDomainsFromBounds
-from dicts import get_grid_function, get_data_function, colormaps, postprocess_function
+from LoadWriteData import LoadConfigFileFromYaml, read_field, build_dataset, write_dataset, write_time_stacked_dataset, is_date_in_nc, get_projection_from_grib, nc_pool
+from times import set_lead_times
+from domains import get_crop_indices, CropDomainsFromIndices, ResolutionToDegrees, ExpandBounds, get_verif_window
+from dicts import colormaps, postprocess_function
 from plots import PlotMapInAxis
+from regridding import get_regrid_operator, apply_operator
+from fieldcache import FieldCache
+from inputcatalog import InputCatalog, get_obs_file_info, get_obs_templates, get_exp_templates
+from obscube import get_obs_source
 
 
-def main(obs, case, exp, relative_indexed_path):
-    print("INFO: RUNNING REGRID EXPERIMENT")
-    # OBS data: database + variable
+# settings shared by the parent process and the regrid workers
+shared = {}
+
+def init_worker(shared_settings):
+    shared.update(shared_settings)
+    # each process keeps its own cache of decoded fields
+    shared['field_cache'] = FieldCache(
+        max_fields=shared_settings['settings']['cache_fields']
+    )
+
+def load_cropped_field(filename, var, fileformat, crop_indices):
+    # decoded values cropped to the regrid domain (before any postprocessing)
+    return read_field(filename, fileformat, var, window=crop_indices).data
+
+def load_exp_field(init_time, lead_time, target_id, exp_file_t, exp_file_dt):
+    # read (and decumulate), crop, postprocess and plot one lead time of an
+    # init for one obs target
+    settings = shared['settings']
+    target = shared['targets'][target_id]
+    init = shared['inits'][init_time]
+    init_target = init['targets'][target_id]
+    field_cache = shared['field_cache']
+    load_function = partial(
+        load_cropped_field,
+        fileformat=settings['exp_fileformat'],
+        crop_indices=init['crop_simus']
+    )
+    date_simus_ini = init['date_simus_ini']
+    exp_var_get = target['exp_var_get']
+    data_t = field_cache.get(exp_file_t, exp_var_get, load_function)
+    if exp_file_dt is not None:
+        print(f"INFO: compute decumulated values")
+        # example: pcp(t) = tp(t) - tp(t-1)
+        # where pcp is 1-hour accumulated precipitation and tp the total precipitation
+        # tp(t-1) is usually held in the cache since it was tp(t) of the
+        # previous lead time
+        data_dt = field_cache.get(exp_file_dt, exp_var_get, load_function)
+        # assume all variables have accumulated values
+        if isinstance(exp_var_get, list):
+            data = []
+            for values_t, values_dt in zip(data_t, data_dt):
+                diff = values_t - values_dt
+                data.append(np.where(diff < 0, 0., diff))
+        else:
+            diff = data_t - data_dt
+            data = np.where(diff < 0, 0., diff)
+    else:
+        data = data_t
+
+    # sub-domain of this target
+    if isinstance(data, list):
+        data = [
+            CropDomainsFromIndices(values, init_target['crop_simus'])
+            for values in data
+        ]
+    else:
+        data = CropDomainsFromIndices(data, init_target['crop_simus'])
+
+    # postprocessing?? (point-wise, so it is applied to the cropped values)
+    if target['postprocess'] != "None":
+        data_fp = postprocess_function[target['postprocess']](data)
+    else:
+        # read-only view of the cached field (not modified afterwards)
+        data_fp = data
+
+    # plot original simus
+    formatter = target['formatter']
+    var_verif = target['var_verif']
+    valid_time = date_simus_ini + timedelta(hours=lead_time)
+    fig = plt.figure(
+        0, figsize=(11. / 2.54, 11. / 2.54), clear=True
+    )
+    ax = fig.add_subplot(
+        1, 1, 1, projection=ccrs.PlateCarree()
+    )
+    ax, cbar = PlotMapInAxis(
+        ax=ax,
+        data=data_fp,
+        lat=init_target['simus_lat'],
+        lon=init_target['simus_lon'],
+        extent=settings['case_domain'],
+        title=formatter.format_string(
+            template="title_orig",
+            valid_time=valid_time,
+            init_time=init_time,
+            lead_time=lead_time
+        ),
+        cb_label = (
+            f"{target['var_verif_description']} "
+            f"({target['var_verif_units']})"
+        ),
+        left_grid_label = False,
+        right_grid_label = True,
+        cmap = colormaps[var_verif]['map'],
+        norm = colormaps[var_verif]['norm']
+    )
+    fig.savefig(
+        formatter.format_string(
+            template="plot_orig",
+            init_time=init_time,
+            lead_time=lead_time,
+            acc_h=target['accum_h']
+        ),
+        dpi=600,
+        bbox_inches='tight',
+        pad_inches=0.05
+    )
+    plt.close(0)
+    return data_fp
+
+def load_exp_fields(task):
+    # each field is decoded once for all the obs targets of the task
+    init_time, lead_time, files_targets = task
+    return [
+        load_exp_field(init_time, lead_time, target_id, exp_file_t, exp_file_dt)
+        for target_id, exp_file_t, exp_file_dt in files_targets
+    ]
+
+def load_exp_fields_chunk(tasks):
+    return [load_exp_fields(task) for task in tasks]
+
+def imap_bounded(pool, tasks, chunksize, max_chunks):
+    # fields of the tasks in order, as pool.imap, but with at most
+    # max_chunks chunks in flight: the workers can not run ahead of the
+    # parent and pile up decoded fields in its memory
+    chunks = [tasks[idx:idx + chunksize] for idx in range(0, len(tasks), chunksize)]
+    in_flight = deque()
+    for chunk in chunks:
+        if len(in_flight) >= max_chunks:
+            yield from in_flight.popleft().get()
+        in_flight.append(pool.apply_async(load_exp_fields_chunk, (chunk,)))
+    while in_flight:
+        yield from in_flight.popleft().get()
+
+def write_regridded_init(init_time, target_id, lead_times, fields):
+    # regridding simus: one sparse matrix product for all lead times
+    settings = shared['settings']
+    target = shared['targets'][target_id]
+    init = shared['inits'][init_time]
+    init_target = init['targets'][target_id]
+    print(
+        f"INFO: Regridding {len(lead_times)} time steps "
+        f"of {init_time} from {settings['exp']} (original grid) "
+        f"to {target['obs_db']} grid"
+    )
+    regridded_fields = apply_operator(
+        init_target['operator'], np.stack(fields), init_target['obs_lat'].shape
+    )
+    if settings['output'] == 'init':
+        # write all lead times in the time-stacked netCDF of the init
+        ds = build_dataset(
+            values=regridded_fields,
+            date=[
+                init['date_simus_ini'] + timedelta(hours=lead_time)
+                for lead_time in lead_times
+            ],
+            lat=init_target['obs_lat'],
+            lon=init_target['obs_lon'],
+            var_name=target['var_verif'],
+            attrs_var={
+                'units': target['var_verif_units'],
+                'long_name': target['var_verif_description']
+            }
+        )
+        write_time_stacked_dataset(
+            ds,
+            target['formatter'].format_regrid(
+                init_time=init_time,
+                lead_time=lead_times[0],
+                acc_h=target['accum_h']
+            )
+        )
+        print('... DONE')
+        return 0
+    for lead_time, regridded_data in zip(lead_times, regridded_fields):
+        # write netCDF
+        ds = build_dataset(
+            values=regridded_data,
+            date=init['date_simus_ini'] + timedelta(hours=lead_time),
+            lat=init_target['obs_lat'],
+            lon=init_target['obs_lon'],
+            var_name=target['var_verif'],
+            attrs_var={
+                'units': target['var_verif_units'],
+                'long_name': target['var_verif_description']
+            }
+        )
+        write_dataset(
+            ds,
+            target['formatter'].format_string(
+                template="regrid",
+                init_time=init_time,
+                lead_time=lead_time,
+                acc_h=target['accum_h']
+            )
+        )
+    print('... DONE')
+
+def load_target(obs, case, exp, relative_indexed_path, config_exp):
+    # settings of an obs target (database + variable)
     obs_db, var_verif = obs.split('_')
-    pattern_to_find = f"*{var_verif}_{obs_db}grid_{case}*.nc"  
 
     # observation database info
     print(f"INFO: Loading OBS YAML file: config/obs_db/config_{obs_db}.yaml")
     config_obs_db = LoadConfigFileFromYaml(
         f"config/obs_db/config_{obs_db}.yaml"
     )
-    obs_filename = config_obs_db['format']['filename'][var_verif]
-    obs_fileformat = config_obs_db['format']['fileformat']
     if config_obs_db['vars'][var_verif]['postprocess']:
         obs_var_get = var_verif
     else:
         obs_var_get = config_obs_db['vars'][var_verif]['var']
     var_verif_description = config_obs_db['vars'][var_verif]['description']
     var_verif_units = config_obs_db['vars'][var_verif]['units']
+    obs_res = config_obs_db['vars'][var_verif]['res']
+    fss_scales = config_obs_db['vars'][var_verif]['verif']['FSS']['scales']
     accum_h = config_obs_db["vars"][var_verif]["verif"]["times"]["accum_hours"]
     freq_verif = config_obs_db["vars"][var_verif]["verif"]["times"]["freq_verif"]
-    # update params if accumulated values
+    # update params if accumulated (or aggregated) values
+    obs_filename, obs_fileformat = get_obs_file_info(config_obs_db, var_verif, accum_h)
     if accum_h > 1:
-        obs_filename = f"acc{accum_h}h_{'.'.join(obs_filename.split('.')[:-1])}.nc"
-        obs_fileformat = "netCDF"
         var_verif_description = var_verif_description.replace(
             "1-hour", f"{accum_h}-hour"
         )
@@ -50,6 +250,31 @@ def main(obs, case, exp, relative_indexed_path):
         f"var. to get: {obs_var_get} ({var_verif_description}, "
         f"in {var_verif_units})"
     )
+    return {
+        'obs': obs,
+        'obs_db': obs_db,
+        'var_verif': var_verif,
+        'obs_fileformat': obs_fileformat,
+        'obs_var_get': obs_var_get,
+        'obs_templates': get_obs_templates(
+            config_obs_db, obs, relative_indexed_path, case, obs_filename
+        ),
+        'var_verif_description': var_verif_description,
+        'var_verif_units': var_verif_units,
+        'obs_res': obs_res,
+        'fss_scales': fss_scales,
+        'accum_h': accum_h,
+        'freq_verif': freq_verif,
+        'exp_var_get': config_exp['vars'][var_verif]['var'],
+        'is_accum': config_exp['vars'][var_verif]['accum'],
+        'verif_at_0h': config_exp['vars'][var_verif]['verif_0h'],
+        'postprocess': config_exp['vars'][var_verif]['postprocess'],
+        'formatter': NamingFormatter(obs, case, exp, relative_indexed_path)
+    }
+
+def main(obs, case, exp, relative_indexed_path, workers=1):
+    print("INFO: RUNNING REGRID EXPERIMENT")
+    # OBS targets: database + variable, several targets separated by commas
 
     # Case data: initial date + end date
     print(f"INFO: Loading CASE YAML file: config/Case/{relative_indexed_path}/config_{case}.yaml")
@@ -58,6 +283,7 @@ def main(obs, case, exp, relative_indexed_path):
     date_end = datetime.strptime(config_case['dates']['end'], '%Y%m%d%H')
     case_domain = config_case['location']['NOzoom']
     bounds_W, bounds_E, bounds_S, bounds_N = case_domain
+    verif_domains = config_case['verif_domain']
     print(
         f"INFO: Loaded config file for {case} case study:\n "
         f'init: {config_case["dates"]["ini"]}; '
@@ -68,289 +294,342 @@ def main(obs, case, exp, relative_indexed_path):
     print(f"INFO: Loading EXP YAML file: config/exp/{relative_indexed_path}/config_{exp}.yaml")
     config_exp = LoadConfigFileFromYaml(f'config/exp/{relative_indexed_path}/config_{exp}.yaml')
     exp_model = config_exp['model']['name']
-    exp_model_in_filename = exp_model.replace(' ', '').replace('.', '-')
     exp_filepaths = config_exp['format']['filepaths']
     exp_filename = config_exp['format']['filename']
     exp_fileformat = config_exp['format']['fileformat']
-    exp_var_get = config_exp['vars'][var_verif]['var']
-    is_accum = config_exp['vars'][var_verif]['accum']
-    verif_at_0h = config_exp['vars'][var_verif]['verif_0h']
-    postprocess = config_exp['vars'][var_verif]['postprocess']
+    exp_link = config_exp['format'].get('link', False)
+    config_regrid = config_exp.get('regrid') or {}
+    regrid_method = config_regrid.get('method', 'linear')
+    regrid_structured = config_regrid.get('structured', False)
+    if regrid_method == 'idw':
+        regrid_options = {
+            k: config_regrid[k] for k in ('neighbours', 'power')
+            if k in config_regrid
+        }
+    else:
+        regrid_options = {}
+    # max. number of decoded fields held in memory (per worker)
+    regrid_cache_fields = config_regrid.get('cache_fields', 4)
+    # regrid output: one file per lead time (default) or per init
+    regrid_output = config_regrid.get('output', 'leadtime')
+    # regrid domain: NOzoom (default) or verif_domain
+    regrid_crop = config_regrid.get('crop', 'NOzoom')
     print(
         f"INFO: Loaded config file for {exp} simulation:\n model: {exp_model};\n "
         f"file paths: {exp_filepaths};\n file name: {exp_filename};\n "
-        f"file format: {exp_fileformat};\n var. to get: {exp_var_get} "
-        f"({var_verif})"
+        f"file format: {exp_fileformat};\n regrid method: {regrid_method} "
+        f"(structured: {regrid_structured});\n regrid domain: {regrid_crop}"
     )
 
-    # naming formatter
-    formatter = NamingFormatter(obs, case, exp, relative_indexed_path)
+    # obs targets
+    targets = [
+        load_target(obs_target, case, exp, relative_indexed_path, config_exp)
+        for obs_target in obs.split(',')
+    ]
+
+    # input files of obs and exps
+    catalog = InputCatalog()
+
+    # crop data to avoid ram issues
+    crop_bounds_case = [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
+    # the exp domain is 1º larger so that all the obs grid points can be
+    # interpolated
+    simus_margin = 1.
+    obs_grids = {}
 
-    # init times of nwp
+    # grids, crop indices and regrid operators are computed here (once per
+    # init) and shared with the workers, which process (init, lead time) tasks
+    inits = {}
+    tasks = []
     for init_time in config_exp['inits'].keys():
 
         date_exp_end = config_exp['inits'][init_time]['fcast_horiz']
-        simus_lat = None
-        simus_lon = None
-
-        # set lead times from experiments
         date_simus_ini = datetime.strptime(init_time, '%Y%m%d%H')
         date_simus_end = datetime.strptime(date_exp_end, '%Y%m%d%H')
-        lead_times = set_lead_times(
-            date_ini=date_ini,
-            date_end=date_end,
-            date_sim_init=date_simus_ini,
-            date_sim_forecast=date_simus_end,
-            freq=freq_verif
+        exp_templates = get_exp_templates(
+            config_exp, exp, init_time, relative_indexed_path
         )
-        if is_accum:
-            lead_times = lead_times[lead_times >= accum_h].copy()
-        elif not verif_at_0h:
-            lead_times = lead_times[lead_times > 0].copy()
-        else:
-            pass
+        path_linked_sim = f"SIMULATIONS/{relative_indexed_path}/{exp}/data_orig/{init_time}"
+        # files of each lead time to regrid for each target
+        files_lead_times = {}
+        bounds_targets = {}
+        for target_id, target in enumerate(targets):
+            # set lead times from experiments
+            lead_times = set_lead_times(
+                date_ini=date_ini,
+                date_end=date_end,
+                date_sim_init=date_simus_ini,
+                date_sim_forecast=date_simus_end,
+                freq=target['freq_verif']
+            )
+            if target['is_accum']:
+                lead_times = lead_times[lead_times >= target['accum_h']].copy()
+            elif not target['verif_at_0h']:
+                lead_times = lead_times[lead_times > 0].copy()
+            else:
+                pass
 
-        if len(lead_times) > 0:
+            if len(lead_times) == 0:
+                print(
+                    "INFO: Valid times outside the lead times availables for "
+                    f"init: {init_time} ({target['obs']}). Avoiding regrid"
+                )
+                continue
             print(
-                f"INFO: Lead times from {exp}: "
+                f"INFO: Lead times from {exp} ({target['obs']}): "
                 f"{init_time}+{str(lead_times[0]).zfill(3)} "
                 f"({datetime.strftime(date_simus_ini + timedelta(hours=lead_times[0].item()), '%Y%m%d%H')}) "
                 f"up to {init_time}+{str(lead_times[-1].item()).zfill(3)} "
                 f"({datetime.strftime(date_simus_ini + timedelta(hours=lead_times[-1].item()), '%Y%m%d%H')}) "
-                f"with frequency: {freq_verif}h"
+                f"with frequency: {target['freq_verif']}h"
             )
 
+            n_lead_times = 0
             for lead_time in lead_times:
-                file_regrid = formatter.format_string(
-                    template="regrid",
+                file_regrid = target['formatter'].format_regrid(
                     init_time=init_time,
                     lead_time=lead_time.item(),
-                    acc_h=accum_h
+                    acc_h=target['accum_h']
                 )
-                if not os.path.isfile(file_regrid):
-                    # link original simus to SIMULATIONS/
-                    files_orig_path = exp_filepaths[config_exp['inits'][init_time]['path']].replace('%exp', exp)
-                    exp_filename_t = lead_time_replace(
-                        exp_filename, lead_time.item()
+                # a file per lead time holds only its date: it is not opened
+                if regrid_output == 'init':
+                    is_saved = is_date_in_nc(
+                        file_regrid, date_simus_ini + timedelta(hours=lead_time.item())
                     )
-                    exp_origin = os.path.join(
-                        datetime.strftime(date_simus_ini, files_orig_path), 
-                        exp_filename_t
+                else:
+                    is_saved = os.path.isfile(file_regrid)
+                if is_saved:
+                    print(
+                        f"INFO: lead time {lead_time} already saved in "
+                        f"'{file_regrid}'. Avoiding regrid"
                     )
-                    path_linked_sim = f"SIMULATIONS/{relative_indexed_path}/{exp}/data_orig/{init_time}"
-                    os.makedirs(os.path.dirname(path_linked_sim), exist_ok=True)
-                    print(f"INFO: linking  {exp_origin} to {path_linked_sim}")
-                    os.system(
-                        f"ln -s {exp_origin} "
-                        f"{path_linked_sim}/"
+                    continue
+                # files of t (and t - accum_h to decumulate)
+                lead_times_file = [lead_time.item()]
+                if target['is_accum'] and (lead_time.item() - target['accum_h']) > 0:
+                    lead_times_file.append(lead_time.item() - target['accum_h'])
+                exp_files = [
+                    catalog.resolve(exp_templates, date_simus_ini, lt)
+                    for lt in lead_times_file
+                ]
+                if None in exp_files:
+                    print(
+                        f"INFO: files of {init_time}+{str(lead_time).zfill(3)} "
+                        f"not found in {exp_templates}. Avoiding regrid"
                     )
+                    continue
+                if exp_link:
+                    # link original simus to SIMULATIONS/
+                    for exp_file in exp_files:
+                        catalog.link(exp_file, path_linked_sim)
+                if len(exp_files) == 1:
+                    exp_files.append(None)
+                files_lead_times.setdefault(lead_time.item(), []).append(
+                    (target_id, *exp_files)
+                )
+                n_lead_times += 1
+            if n_lead_times == 0:
+                continue
 
-                    # check lat-lon coordinates from original exps are already retrieved
-                    if simus_lat is None and simus_lon is None:
-                        obs_file = datetime.strftime(
-                            date_ini,
-                            f'OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}/{obs_filename}'
-                        )
-                        simus_file = datetime.strftime(
-                            date_simus_ini,
-                            f"{path_linked_sim}/{exp_filename_t}"
-                        )
-                        obs_lat_orig, obs_lon_orig = get_grid_function[obs_fileformat](obs_file)
-                        simus_lat_orig, simus_lon_orig = get_grid_function[exp_fileformat](simus_file)
-
-                        # crop data to avoid ram issues
-                        obs_lat = CropDomainsFromBounds(
-                            obs_lat_orig,
-                            obs_lat_orig,
-                            obs_lon_orig,
-                            [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
-                        )
-                        obs_lon = CropDomainsFromBounds(
-                            obs_lon_orig,
-                            obs_lat_orig,
-                            obs_lon_orig,
-                            [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
-                        )
-                        simus_lat = CropDomainsFromBounds(
-                            simus_lat_orig,
-                            simus_lat_orig,
-                            simus_lon_orig,
-                            [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
-                        )
-                        simus_lon = CropDomainsFromBounds(
-                            simus_lon_orig,
-                            simus_lat_orig,
-                            simus_lon_orig,
-                            [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
-                        )
-                        print(
-                            f"INFO: selected domain for {obs_db}:\n "
-                            f"llc: ({obs_lat[0, 0].round(2)}, "
-                            f"{obs_lon[0, 0].round(2)}); "
-                            f"urc: ({obs_lat[-1, -1].round(2)}, "
-                            f"{obs_lon[-1, -1].round(2)})"
-                        )
-                        print(
-                            f"INFO: selected domain for {exp}:\n "
-                            f"llc: ({simus_lat[0, 0].round(2)}, "
-                            f"{simus_lon[0, 0].round(2)}); "
-                            f"urc: ({simus_lat[-1, -1].round(2)}, "
-                            f"{simus_lon[-1, -1].round(2)})"
-                        )
-
-                    if is_accum and (lead_time.item() - accum_h) > 0:
-                        print(f"INFO: compute decumulated values")
-                        # link original simus to SIMULATIONS/
-                        exp_filename_dt = lead_time_replace(
-                            exp_filename, lead_time.item() - accum_h
-                        )
-                        exp_origin_dt = os.path.join(
-                            datetime.strftime(
-                                date_simus_ini, files_orig_path
-                            ),
-                            exp_filename_dt
-                        )
-                        os.system(
-                            f"ln -s {exp_origin_dt} "
-                            f"{path_linked_sim}/"
-                        )
-
-                        # example: pcp(t) = tp(t) - tp(t-1)
-                        # where pcp is 1-hour accumulated precipitation and tp the total precipitation
-                        data_t = get_data_function[exp_fileformat](
-                            datetime.strftime(
-                                date_simus_ini,
-                                f"{path_linked_sim}/{exp_filename_t}"
-                            ),
-                            exp_var_get
-                        )
-                        data_dt = get_data_function[exp_fileformat](
-                            datetime.strftime(
-                                date_simus_ini,
-                                f"{path_linked_sim}/{exp_filename_dt}"
-                            ),
-                            exp_var_get
-                        )
-                        # assume all variables have accumulated values
-                        if isinstance(exp_var_get, list):
-                            data = []
-                            for values_t, values_dt in zip(data_t, data_dt):
-                                diff = values_t - values_dt
-                                data.append(np.where(diff < 0, 0., diff))
-                        else:
-                            diff = data_t - data_dt
-                            data = np.where(diff < 0, 0., diff)
-                    else:
-                        data = get_data_function[exp_fileformat](
-                            datetime.strftime(
-                                date_simus_ini,
-                                f"{path_linked_sim}/{exp_filename_t}"
-                            ),
-                            exp_var_get
-                        )
-                    
-                    # postprocessing?? and crop
-                    if postprocess != "None":
-                        data_raw_domain = postprocess_function[postprocess](
-                            data
-                        )
-                        data_fp = CropDomainsFromBounds(
-                            data_raw_domain,
-                            simus_lat_orig,
-                            simus_lon_orig,
-                            [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
-                        )
-                    else:
-                        data_fp = CropDomainsFromBounds(
-                            data,
-                            simus_lat_orig,
-                            simus_lon_orig,
-                            [bounds_W - 5., bounds_E + 5., bounds_S - 5., bounds_N + 5.]
-                        )
-        
-                    # plot original simus
-                    valid_time = date_simus_ini + timedelta(hours=lead_time.item())
-                    fig = plt.figure(
-                        0, figsize=(11. / 2.54, 11. / 2.54), clear=True
-                    )
-                    ax = fig.add_subplot(
-                        1, 1, 1, projection=ccrs.PlateCarree()
-                    )
-                    ax, cbar = PlotMapInAxis(
-                        ax=ax,
-                        data=data_fp,
-                        lat=simus_lat,
-                        lon=simus_lon,
-                        extent=case_domain,
-                        title=formatter.format_string(
-                            template="title_orig",
-                            valid_time=valid_time,
-                            init_time=init_time,
-                            lead_time=lead_time.item()
-                        ),
-                        cb_label = (
-                            f"{var_verif_description} ({var_verif_units})"
-                        ),
-                        left_grid_label = False,
-                        right_grid_label = True,
-                        cmap = colormaps[var_verif]['map'],
-                        norm = colormaps[var_verif]['norm']
-                    )
-                    fig.savefig(
-                        formatter.format_string(
-                            template="plot_orig",
-                            init_time=init_time,
-                            lead_time=lead_time.item(),
-                            acc_h=accum_h
-                        ),
-                        dpi=600,
-                        bbox_inches='tight',
-                        pad_inches=0.05
-                    )
-                    plt.close(0)
-                    
-                    # regridding simus
+            # regrid domain of this init and target
+            crop_bounds = None
+            if regrid_crop == 'verif_domain':
+                # the halo covers the largest FSS neighbourhood
+                verif_halo = (
+                    max(target['fss_scales'])
+                    * ResolutionToDegrees(target['obs_res'])
+                )
+                crop_bounds = get_verif_window(
+                    valid_times=[
+                        date_simus_ini + timedelta(hours=lt.item())
+                        for lt in lead_times
+                    ],
+                    verif_domains=verif_domains,
+                    halo=verif_halo,
+                    limits=crop_bounds_case
+                )
+                if crop_bounds is None:
                     print(
-                        f"INFO: Regridding {init_time}+{str(lead_time).zfill(2)} "
-                        f"time step from {exp} (original grid)"
-                    )
-                    regridded_data = griddata(
-                        (simus_lon.flatten(), simus_lat.flatten()),
-                        data_fp.flatten(),
-                        (obs_lon, obs_lat),
-                        method = 'linear'
-                    )
-        
-                    # write netCDF
-                    ds = build_dataset(
-                        values=regridded_data,
-                        date=date_simus_ini + timedelta(hours=lead_time.item()),
-                        lat=obs_lat,
-                        lon=obs_lon,
-                        var_name=var_verif,
-                        attrs_var={
-                            'units': var_verif_units,
-                            'long_name': var_verif_description
-                        }
+                        "INFO: verif domain not established for all the "
+                        f"valid times of init {init_time}. Using NOzoom domain"
                     )
-                    ds.to_netcdf(
-                        file_regrid,
-                        encoding={
-                            'time': {'units': 'seconds since 1970-01-01'}
-                        }
-                    )
-                    print('... DONE')
+                    crop_bounds = crop_bounds_case
+                    crop_bounds_simus = crop_bounds_case
                 else:
-                    print(
-                        f"INFO: file '{file_regrid}' already exists. "
-                        "Avoiding regrid"
+                    crop_bounds_simus = ExpandBounds(
+                        crop_bounds, simus_margin, crop_bounds_case
                     )
-        else:
+            else:
+                crop_bounds = crop_bounds_case
+                crop_bounds_simus = crop_bounds_case
+            bounds_targets[target_id] = (crop_bounds, crop_bounds_simus)
+
+        if len(files_lead_times) == 0:
+            continue
+
+        # lat-lon coordinates from original exps, cropped to the union of the
+        # domains of all the targets
+        # (file t of the first target of any lead time)
+        simus_file = next(iter(files_lead_times.values()))[0][1]
+        simus_lat_orig, simus_lon_orig = read_field(simus_file, exp_fileformat).grid
+        simus_projection = None
+        if regrid_structured:
+            # native projection of the simus: config or grib keys
+            simus_projection = config_exp['format'].get('projection')
+            if not simus_projection and exp_fileformat == 'Grib':
+                simus_projection = get_projection_from_grib(simus_file)
+        bounds_simus = np.array([b[1] for b in bounds_targets.values()])
+        crop_bounds_union = [
+            bounds_simus[:, 0].min(), bounds_simus[:, 1].max(),
+            bounds_simus[:, 2].min(), bounds_simus[:, 3].max()
+        ]
+        crop_simus = get_crop_indices(simus_lat_orig, simus_lon_orig, crop_bounds_union)
+        simus_lat = CropDomainsFromIndices(simus_lat_orig, crop_simus)
+        simus_lon = CropDomainsFromIndices(simus_lon_orig, crop_simus)
+        print(
+            f"INFO: selected domain for {exp}:\n "
+            f"llc: ({simus_lat[0, 0].round(2)}, "
+            f"{simus_lon[0, 0].round(2)}); "
+            f"urc: ({simus_lat[-1, -1].round(2)}, "
+            f"{simus_lon[-1, -1].round(2)})"
+        )
+
+        inits[init_time] = {
+            'date_simus_ini': date_simus_ini,
+            'crop_simus': crop_simus,
+            'targets': {}
+        }
+        for target_id, (crop_bounds, crop_bounds_simus) in bounds_targets.items():
+            target = targets[target_id]
+            # lat-lon coordinates from obs (read once per target)
+            if target_id not in obs_grids:
+                obs_source = get_obs_source(
+                    target['obs_templates'], target['obs'], case,
+                    relative_indexed_path, target['obs_var_get'], target['accum_h']
+                )
+                if date_ini not in obs_source:
+                    raise FileNotFoundError(
+                        f"ERROR: obs not found at {date_ini} in {target['obs_templates']}"
+                    )
+                obs_grids[target_id] = obs_source.read_field(
+                    date_ini, target['obs_fileformat']
+                ).grid
+            obs_lat_orig, obs_lon_orig = obs_grids[target_id]
+            crop_obs = get_crop_indices(obs_lat_orig, obs_lon_orig, crop_bounds)
+            obs_lat = CropDomainsFromIndices(obs_lat_orig, crop_obs)
+            obs_lon = CropDomainsFromIndices(obs_lon_orig, crop_obs)
             print(
-                "INFO: Valid times outside the lead times availables for "
-                f"init: {init_time}. Avoiding regrid"
+                f"INFO: selected domain for {target['obs_db']}:\n "
+                f"llc: ({obs_lat[0, 0].round(2)}, "
+                f"{obs_lon[0, 0].round(2)}); "
+                f"urc: ({obs_lat[-1, -1].round(2)}, "
+                f"{obs_lon[-1, -1].round(2)})"
             )
+            # sub-window of the exp domain for this target
+            crop_simus_target = get_crop_indices(simus_lat, simus_lon, crop_bounds_simus)
+            simus_lat_target = CropDomainsFromIndices(simus_lat, crop_simus_target)
+            simus_lon_target = CropDomainsFromIndices(simus_lon, crop_simus_target)
+            inits[init_time]['targets'][target_id] = {
+                'crop_simus': crop_simus_target,
+                'simus_lat': simus_lat_target,
+                'simus_lon': simus_lon_target,
+                'obs_lat': obs_lat,
+                'obs_lon': obs_lon,
+                'operator': get_regrid_operator(
+                    src_lat=simus_lat_target,
+                    src_lon=simus_lon_target,
+                    dst_lat=obs_lat,
+                    dst_lon=obs_lon,
+                    method=regrid_method,
+                    projection=simus_projection,
+                    options=regrid_options
+                )
+            }
+        tasks.extend([
+            (init_time, lead_time, files_lead_times[lead_time])
+            for lead_time in sorted(files_lead_times.keys())
+        ])
+
+    if len(tasks) == 0:
+        return 0
+
+    shared_settings = {
+        'settings': {
+            'exp': exp,
+            'exp_fileformat': exp_fileformat,
+            'cache_fields': regrid_cache_fields,
+            'output': regrid_output,
+            'case_domain': case_domain
+        },
+        'targets': targets,
+        # operators stay in the parent process
+        'inits': {
+            init_time: {
+                'date_simus_ini': init['date_simus_ini'],
+                'crop_simus': init['crop_simus'],
+                'targets': {
+                    target_id: {
+                        k: v for k, v in init_target.items() if k != 'operator'
+                    }
+                    for target_id, init_target in init['targets'].items()
+                }
+            }
+            for init_time, init in inits.items()
+        }
+    }
+    init_worker(shared_settings)
+    shared['inits'] = inits
+    print(f"INFO: processing {len(tasks)} time steps with {workers} worker(s)")
+    if workers > 1:
+        # netCDF files opened by this process are not shared with the workers
+        nc_pool.close_all()
+        pool = Pool(
+            processes=workers,
+            initializer=init_worker,
+            initargs=(shared_settings,)
+        )
+        # consecutive lead times of an init are sent to the same worker
+        fields_iter = imap_bounded(
+            pool,
+            tasks,
+            chunksize=max(1, min(len(tasks) // (4 * workers), 4)),
+            max_chunks=2 * workers
+        )
+    else:
+        pool = None
+        fields_iter = map(load_exp_fields, tasks)
+
+    # tasks are ordered by init: the lead times of an init are regridded and
+    # written in batches of up to max_batch time steps (and when the init
+    # changes), so the parent never holds a whole long forecast
+    max_batch = max(8, 2 * workers)
+    init_current = None
+    fields_init = {}
+    n_batch = 0
+    for (init_time, lead_time, files_targets), fields in zip(tasks, fields_iter):
+        if init_time != init_current or n_batch >= max_batch:
+            for target_id, (lead_times_target, fields_target) in fields_init.items():
+                write_regridded_init(init_current, target_id, lead_times_target, fields_target)
+            fields_init = {}
+            n_batch = 0
+        init_current = init_time
+        n_batch += 1
+        for (target_id, _, _), data_fp in zip(files_targets, fields):
+            lead_times_target, fields_target = fields_init.setdefault(target_id, ([], []))
+            lead_times_target.append(lead_time)
+            fields_target.append(data_fp)
+    for target_id, (lead_times_target, fields_target) in fields_init.items():
+        write_regridded_init(init_current, target_id, lead_times_target, fields_target)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    else:
+        print(f"INFO: {shared['field_cache']}")
     return 0
 
 if __name__ == '__main__':
-    main(str(sys.argv[1]), str(sys.argv[2]), str(sys.argv[3]), str(sys.argv[4]) )
+    if len(sys.argv) > 5:
+        n_workers = int(sys.argv[5])
+    else:
+        n_workers = 1
+    main(str(sys.argv[1]), str(sys.argv[2]), str(sys.argv[3]), str(sys.argv[4]), n_workers)
@@ -1,9 +1,9 @@
 import os
 import numpy as np
+from functools import partial
 import pandas as pd
 import seaborn as sns
 from datetime import datetime, timedelta
-from pysteps import verification
 from matplotlib import pyplot as plt
 from matplotlib.colors import from_levels_and_colors
 import sys
@@ -11,15 +11,18 @@ import sys
 sys.path.append('scripts/libs/')
 from namingformatter import NamingFormatter
 from miscelanea import str2bool
-from LoadWriteData import LoadConfigFileFromYaml, LoadPickle, SavePickle
+from LoadWriteData import LoadConfigFileFromYaml, read_field, LoadPickle, SavePickle, TimeSeriesNC
+from inputcatalog import get_obs_file_info, get_obs_templates
+from obscube import get_obs_source
 from times import set_lead_times
-from domains import set_domain_verif, CropDomainsFromBounds
+from domains import set_domain_verif, get_crop_indices, CropDomainsFromBounds
+from prefetch import Prefetcher
 from customSAL import SAL, _sal_detect_objects
-from dicts import get_grid_function, get_data_function, colormaps
+from customFSS import fss_matrix
+from dicts import colormaps
 from plots import plot_fss_scores, plot_sal, plot_detected_objects
 
 offset = {'bt': 0}
-fss = verification.get_method("FSS")
 
 def PixelToDistanceStr(nPixels, resolution):
     valueStr, units = resolution.split(' ')
@@ -39,8 +42,6 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     config_obs_db = LoadConfigFileFromYaml(
         f'config/obs_db/config_{obs_db}.yaml'
     )
-    obs_filename = config_obs_db['format']['filename'][var_verif]
-    obs_fileformat = config_obs_db['format']['fileformat']
     if config_obs_db['vars'][var_verif]['postprocess']:
         obs_var_get = var_verif
     else:
@@ -49,10 +50,8 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     var_verif_units = config_obs_db['vars'][var_verif]['units']
     accum_h = config_obs_db["vars"][var_verif]["verif"]["times"]["accum_hours"]
     freq_verif = config_obs_db["vars"][var_verif]["verif"]["times"]["freq_verif"]
-    # update params if accumulated values
-    if accum_h > 1:
-        obs_filename = f"acc{accum_h}h_{'.'.join(obs_filename.split('.')[:-1])}.nc"
-        obs_fileformat = "netCDF"
+    # update params if accumulated (or aggregated) values
+    obs_filename, obs_fileformat = get_obs_file_info(config_obs_db, var_verif, accum_h)
     print(
         f"INFO: Loaded config file for {obs_db} database:\n "
         f"file name: {obs_filename};\n file format: {obs_fileformat};\n "
@@ -89,6 +88,62 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     # naming formatter
     formatter = NamingFormatter(obs, case, exp, relative_indexed_path)
 
+    # input files of obs
+    obs_inventory = get_obs_source(
+        get_obs_templates(
+            config_obs_db, obs, relative_indexed_path, case, obs_filename
+        ),
+        obs, case, relative_indexed_path, obs_var_get, accum_h
+    )
+    # grid of the obs database (shared by all its files) and indices of the
+    # verif domains in it
+    obs_grid = None
+    obs_windows = {}
+
+    def read_lead_time(date_simus_ini, nwp_series, lead_time):
+        # obs and regridded exp values of a lead time cropped to the verif
+        # domain (None if any file is not found). Called in background threads
+        nonlocal obs_grid
+        valid_time = date_simus_ini + timedelta(hours=lead_time.item())
+        file_obs = obs_inventory.get(valid_time)
+        if file_obs is None or valid_time not in nwp_series:
+            return file_obs, None
+        field_nwp = nwp_series.read_field(var_verif, valid_time)
+        data_nwp = field_nwp.data
+        lat2D, lon2D = field_nwp.grid
+
+        # set verif domain
+        verif_domain = set_domain_verif(valid_time, verif_domains)
+        if verif_domain is None:
+            verif_domain = [
+                lon2D[:, 0].max() + 0.5,
+                lon2D[:, -1].min() - 0.5,
+                lat2D[0, :].max() + 0.5,
+                lat2D[-1, :].min() - 0.5
+            ]
+            print(
+                "INFO: verif domain not established at "
+                f'{datetime.strftime(valid_time, "%Y%m%d%H")} '
+                f"UTC. By default: {verif_domain}"
+            )
+
+        # crop data to common domain (only the window of the verif domain is
+        # read from obs files)
+        data_nwp_common = CropDomainsFromBounds(
+            data_nwp, lat2D, lon2D, verif_domain
+        )
+        if obs_grid is None:
+            obs_grid = obs_inventory.read_field(valid_time, obs_fileformat).grid
+        if tuple(verif_domain) not in obs_windows:
+            obs_windows[tuple(verif_domain)] = get_crop_indices(
+                obs_grid[0], obs_grid[1], verif_domain
+            )
+        data_obs_common = obs_inventory.read_field(
+            valid_time, obs_fileformat, obs_var_get,
+            window=obs_windows[tuple(verif_domain)]
+        ).data
+        return file_obs, (data_nwp_common, data_obs_common)
+
     # replace outputs bool
     repl_outputs = str2bool(replace_bool)
 
@@ -175,64 +230,46 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
     
             lt_no_verif = lead_times[np.isin(lead_times, verified_lt) == False].copy()
             print(f"INFO: verifying {lt_no_verif} timesteps")
+            # timesteps without obs are not read
+            obs_gaps = obs_inventory.gaps(
+                date_simus_ini + timedelta(hours=lead_time.item())
+                for lead_time in lt_no_verif
+            )
+            if len(obs_gaps) > 0:
+                print(
+                    "INFO: obs not found at "
+                    f"{[datetime.strftime(date, '%Y%m%d%H') for date in obs_gaps]}"
+                )
             
-            score = {} # this dict will be used to build pandas.dataframe and included them into dictFSS
             listFSS_fcst = []
-            for lead_time in lt_no_verif:
-                file_obs = datetime.strftime(
-                    date_simus_ini + timedelta(hours=lead_time.item()),
-                    f'OBSERVATIONS/data_{obs}/{relative_indexed_path}/{case}/{obs_filename}'
+            # regridded files of the init as a single time series
+            nwp_series = TimeSeriesNC({
+                date_simus_ini + timedelta(hours=lead_time.item()): formatter.format_regrid(
+                    init_time=init_time, lead_time=lead_time.item(), acc_h=accum_h
                 )
-                file_nwp = formatter.format_string(
-                    template="regrid",
+                for lead_time in lt_no_verif
+            })
+            # files of the next lead times are read while the current one
+            # is verified
+            prefetcher = Prefetcher(
+                lt_no_verif,
+                partial(read_lead_time, date_simus_ini, nwp_series)
+            )
+            for lead_time, (file_obs, data_common) in prefetcher:
+                file_nwp = formatter.format_regrid(
                     init_time=init_time,
                     lead_time=lead_time.item(),
                     acc_h=accum_h
                 )
-                if os.path.isfile(file_obs) and os.path.isfile(file_nwp):
-                    data_obs = get_data_function[obs_fileformat](
-                        file_obs, obs_var_get
-                    )
-                    obs_lat, obs_lon = get_grid_function[obs_fileformat](
-                        file_obs
-                    )
-                    data_nwp = get_data_function['netCDF'](
-                        file_nwp, var_verif
-                    )
-                    lat2D, lon2D = get_grid_function['netCDF'](file_nwp)
-        
-                    # set verif domain
-                    verif_domain = set_domain_verif(
-                        date_simus_ini + timedelta(hours=lead_time.item()), 
-                        verif_domains
-                    )
-                    if verif_domain is None:
-                        verif_domain = [
-                            lon_nwp[:, 0].max() + 0.5,
-                            lon_nwp[:, -1].min() - 0.5,
-                            lat_nwp[0, :].max() + 0.5,
-                            lat_nwp[-1, :].min() - 0.5
-                        ]
-                        print(
-                            "INFO: verif domain not established at "
-                            f'{datetime.strftime(date_simus_ini + timedelta(hours=lead_time.item()), "%Y%m%d%H")} '
-                            f"UTC. By default: {verif_domain}"
-                        )
-
-                    # crop data to common domain
-                    data_nwp_common = CropDomainsFromBounds(
-                        data_nwp, lat2D, lon2D, verif_domain
-                    )
-                    data_obs_common = CropDomainsFromBounds(
-                        data_obs, obs_lat, obs_lon, verif_domain
-                    )
+                if data_common is not None:
+                    data_nwp_common, data_obs_common = data_common
 
                     # if the minimum values are searched, the array values have to be inverted due to the FSS and SAL methods 
                     # only allow searching for values above the selected thresholds. An offset must be added because 
                     # negative values are filtered out by the object detection algorithm. This offset is hard-coded in this script.
                     if find_min == True:
-                        data_nwp_common = -1.0 * data_nwp_common.copy() + offset[var_verif]
-                        data_obs_common = -1.0 * data_obs_common.copy() + offset[var_verif]
+                        data_nwp_common = np.subtract(offset[var_verif], data_nwp_common)
+                        data_obs_common = np.subtract(offset[var_verif], data_obs_common)
                         thresh = [-1.0 * thr + offset[var_verif] for thr in thresh]
                         # addapted colorbar only for object detection
                         cmap, norm = from_levels_and_colors(
@@ -244,28 +281,17 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
                         cmap = colormaps[var_verif]['map']
                         norm = colormaps[var_verif]['norm']
 
-                    # FSS at each lead time
-                    score[str(lead_time).zfill(2)] = {}
+                    # FSS at each lead time (all thresholds and scales at once)
                     print(
                         'INFO: Compute FSS for timestep '
                         f'{init_time}+{str(lead_time).zfill(3)} '
                         f'({datetime.strftime(date_simus_ini + timedelta(hours=lead_time.item()), "%Y%m%d%H")})\n '
                         f"scales: {fss_nameCols}\n threshold: {fss_nameRows}"
                     )
-                    for scale, nameCol in zip(scales, fss_nameCols):
-                        score[str(lead_time).zfill(2)][nameCol] = []
-                        for thr in thresh:
-                            score[str(lead_time).zfill(2)][nameCol].append(
-                                fss(
-                                    data_nwp_common,
-                                    data_obs_common,
-                                    thr,
-                                    scale
-                                )
-                            )
                     dictFSS[str(lead_time).zfill(2)] = pd.DataFrame(
-                        score[str(lead_time).zfill(2)],
-                        index = fss_nameRows
+                        fss_matrix(data_nwp_common, data_obs_common, thresh, scales),
+                        index = fss_nameRows,
+                        columns = fss_nameCols
                     )
                     listFSS_fcst.append(
                         dictFSS[str(lead_time).zfill(2)].values.copy()
@@ -348,6 +374,7 @@ def main(obs, case, exp, relative_indexed_path, replace_bool):
                         bbox_inches='tight', 
                         pad_inches=0.05
                     )
+                    plt.close(fig)
         
                     # plot SAL at each lead time
                     figname_sal = formatter.format_string(
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the libraries are imported as the scripts do (sys.path 'scripts/libs/')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'scripts', 'libs'))
@@ -0,0 +1,202 @@
+import numpy as np
+import pytest
+from datetime import datetime
+
+from domains import CropDomainsFromIndices, CropDomainsFromBounds
+from PostProcess import (
+    KelvinToCelsius, IrradianceToBrightnessTemperature, Reflectivity_dBZ,
+    MetersToMilimeters, compute_total_precipitation
+)
+from fieldcache import FieldCache
+from gridcache import get_cached_grid
+from LoadWriteData import build_dataset, write_dataset, SavePickle, LoadPickle
+
+# the readers, crops and postprocessing functions return views and work in
+# place (user-017): these tests check that the caller's arrays, cached fields
+# and read-only memory maps are never modified through them
+
+
+def get_field(shape=(40, 50), seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.gamma(0.5, 4., shape) + 0.1).astype(np.float32)
+
+def get_read_only(values):
+    values = values.copy()
+    values.setflags(write=False)
+    return values
+
+@pytest.fixture
+def memmap_field(tmp_path):
+    # field as read from the field store: read-only memory map
+    np.save(tmp_path / 'field.npy', get_field())
+    return np.load(tmp_path / 'field.npy', mmap_mode='r')
+
+def get_grid(shape=(40, 50)):
+    lon, lat = np.meshgrid(
+        np.linspace(-5., 2., shape[1]), np.linspace(36., 42., shape[0])
+    )
+    return lat, lon
+
+
+# crops
+
+def test_crop_returns_view():
+    values = get_field()
+    cropped = CropDomainsFromIndices(values, (5, 20, 10, 30))
+    assert cropped.shape == (15, 20)
+    assert np.shares_memory(cropped, values)
+
+def test_crop_copy_does_not_leak():
+    values = get_field()
+    reference = values.copy()
+    cropped = CropDomainsFromIndices(values, (5, 20, 10, 30), copy=True)
+    assert not np.shares_memory(cropped, values)
+    cropped += 100.
+    np.testing.assert_array_equal(values, reference)
+
+def test_crop_from_bounds_copy_does_not_leak():
+    values = get_field()
+    reference = values.copy()
+    lat, lon = get_grid()
+    cropped = CropDomainsFromBounds(values, lat, lon, [-3., 0., 38., 40.], copy=True)
+    assert not np.shares_memory(cropped, values)
+    cropped[...] = 0.
+    np.testing.assert_array_equal(values, reference)
+
+def test_crop_of_read_only_field_is_read_only(memmap_field):
+    cropped = CropDomainsFromIndices(memmap_field, (5, 20, 10, 30))
+    with pytest.raises(ValueError):
+        cropped[0, 0] = 0.
+
+
+# postprocessing
+
+POSTPROCESS_CASES = [
+    (KelvinToCelsius, lambda x: x - 273.15),
+    (MetersToMilimeters, lambda x: x * 1000.),
+    (
+        Reflectivity_dBZ,
+        lambda x: 10. * np.log10(np.maximum(1., 200. * x ** 1.6))
+    ),
+    (
+        IrradianceToBrightnessTemperature,
+        lambda x: (
+            (1.43877 * 930.659 / np.log(1.19104e-5 * 930.659 ** 3 / x + 1.) - 0.627)
+            / 0.9983 - 273.15
+        )
+    ),
+]
+
+@pytest.mark.parametrize('function, reference_function', POSTPROCESS_CASES)
+def test_postprocess_does_not_modify_input(function, reference_function):
+    values = get_read_only(get_field())
+    reference = values.copy()
+    result = function(values)
+    np.testing.assert_array_equal(values, reference)
+    assert not np.shares_memory(result, values)
+    np.testing.assert_allclose(result, reference_function(reference), rtol=1e-5)
+
+@pytest.mark.parametrize('function, reference_function', POSTPROCESS_CASES)
+def test_postprocess_of_memmap(function, reference_function, memmap_field):
+    reference = np.array(memmap_field)
+    result = function(memmap_field)
+    np.testing.assert_array_equal(memmap_field, reference)
+    assert not np.shares_memory(result, memmap_field)
+    # the result is a new array that can be modified
+    result += 1.
+
+def test_total_precipitation_does_not_modify_inputs(memmap_field):
+    fields = [get_read_only(get_field(seed=1)), memmap_field, get_read_only(get_field(seed=2))]
+    references = [np.array(values) for values in fields]
+    total = compute_total_precipitation(fields)
+    for values, reference in zip(fields, references):
+        np.testing.assert_array_equal(values, reference)
+        assert not np.shares_memory(total, values)
+    np.testing.assert_allclose(total, references[0] + references[1] + references[2], rtol=1e-6)
+
+
+# cached fields and grids
+
+def test_field_cache_fields_are_read_only():
+    cache = FieldCache(max_fields=2)
+    field = cache.get('file_t', 'tp', lambda filename, var: get_field())
+    with pytest.raises(ValueError):
+        field += 1.
+    # a view handed on (e.g. a crop without postprocessing) is read-only too
+    cropped = CropDomainsFromIndices(field, (0, 10, 0, 10))
+    with pytest.raises(ValueError):
+        cropped[...] = 0.
+    assert cache.get('file_t', 'tp', lambda filename, var: None) is field
+
+def test_field_cache_lists_are_read_only():
+    cache = FieldCache(max_fields=2)
+    fields = cache.get('file_t', ['rain', 'snow'], lambda filename, var: [get_field(), get_field(seed=1)])
+    for values in fields:
+        assert not values.flags.writeable
+
+def test_decumulation_of_cached_fields():
+    # as regrid.py: tp(t) - tp(t - dt) is a new array, the cached ones are
+    # left unchanged
+    cache = FieldCache(max_fields=2)
+    data_t = cache.get('file_t', 'tp', lambda filename, var: get_field() + 10.)
+    data_dt = cache.get('file_dt', 'tp', lambda filename, var: get_field(seed=1))
+    reference_t, reference_dt = data_t.copy(), data_dt.copy()
+    diff = data_t - data_dt
+    data = np.where(diff < 0, 0., diff)
+    data += 1.
+    np.testing.assert_array_equal(data_t, reference_t)
+    np.testing.assert_array_equal(data_dt, reference_dt)
+
+def test_cached_grid_is_read_only(tmp_path):
+    lat, lon = get_grid()
+    cached_lat, cached_lon = get_cached_grid(
+        ('test', str(tmp_path)), lambda: (lat.copy(), lon.copy()), cache_dir=str(tmp_path)
+    )
+    for values in (cached_lat, cached_lon):
+        with pytest.raises(ValueError):
+            values[0, 0] = 0.
+    np.testing.assert_array_equal(cached_lat, lat)
+
+
+# datasets, netCDF files and pickles
+
+def test_build_dataset_does_not_leak_attrs():
+    lat, lon = get_grid()
+    attrs_var = {'units': 'mm'}
+    ds = build_dataset(get_field(), datetime(2022, 5, 3, 12), lat, lon, 'pcp', attrs_var=attrs_var)
+    assert attrs_var == {'units': 'mm'}
+    assert ds['pcp'].attrs['coordinates'] == 'time lat lon'
+    ds_default = build_dataset(get_field(), datetime(2022, 5, 3, 12), lat, lon, 'pcp')
+    assert 'units' not in ds_default['pcp'].attrs
+
+def test_write_dataset_does_not_modify_dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    lat, lon = get_grid()
+    values = get_read_only(get_field())
+    ds = build_dataset(values, datetime(2022, 5, 3, 12), lat, lon, 'pcp', attrs_var={'units': 'mm'})
+    ds['pcp'].encoding['dtype'] = 'int16'
+    attrs = dict(ds.attrs)
+    write_dataset(ds, str(tmp_path / 'pcp.nc'))
+    assert ds['pcp'].encoding == {'dtype': 'int16'}
+    assert ds.attrs == attrs
+    assert 'lat' in ds.coords
+    np.testing.assert_array_equal(ds['pcp'].values[0], values)
+
+def test_save_pickle_does_not_modify_input(tmp_path):
+    values = get_read_only(get_field())
+    scores = {'values': values}
+    SavePickle(scores, str(tmp_path / 'scores.pkl'))
+    assert scores['values'] is values
+    np.testing.assert_array_equal(LoadPickle(str(tmp_path / 'scores.pkl'))['values'], values)
+
+
+# SAL
+
+def test_sal_does_not_modify_inputs(memmap_field):
+    customSAL = pytest.importorskip('customSAL')
+    prediction = get_read_only(get_field(seed=3))
+    references = (prediction.copy(), np.array(memmap_field))
+    sal = customSAL.SAL(prediction, memmap_field)
+    assert len(sal) == 3
+    np.testing.assert_array_equal(prediction, references[0])
+    np.testing.assert_array_equal(memmap_field, references[1])
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import LoadWriteData
+from fieldstore import FieldStore, fill_masked
+
+# fields of grib messages with a bitmap are masked arrays: the field store
+# must return the same values as the first (fresh) read (user-015)
+
+
+def get_masked_field():
+    values = np.full((6, 8), 9999., dtype=np.float32)
+    mask = np.ones(values.shape, dtype=bool)
+    values[2:4, 3:5] = 2.
+    mask[2:4, 3:5] = False
+    return np.ma.MaskedArray(values, mask=mask)
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = FieldStore(str(tmp_path / 'fields'))
+    monkeypatch.setattr(LoadWriteData, 'get_field_store', lambda: store)
+    return store
+
+def test_fill_masked():
+    values = fill_masked(get_masked_field())
+    assert not isinstance(values, np.ma.MaskedArray)
+    assert np.isnan(values).sum() == 6 * 8 - 4
+    assert np.nanmean(values) == 2.
+    unmasked = np.ones((2, 2), dtype=np.float32)
+    assert fill_masked(unmasked) is unmasked
+
+def test_masked_arrays_are_not_stored(store):
+    store.save('key', get_masked_field())
+    assert store.load('key') is None
+
+def test_store_round_trip_of_masked_field(store, tmp_path, monkeypatch):
+    file_grib = tmp_path / 'field.grib'
+    file_grib.write_bytes(b'GRIB')
+    n_reads = []
+
+    def read_field_from_file(filename, fileformat, vars, date, window):
+        n_reads.append(filename)
+        return LoadWriteData.Field([get_masked_field()], lambda: None)
+
+    monkeypatch.setattr(LoadWriteData, 'read_field_from_file', read_field_from_file)
+    fresh = LoadWriteData.read_field(str(file_grib), 'Grib', 'tp').data
+    stored = LoadWriteData.read_field(str(file_grib), 'Grib', 'tp').data
+    assert len(n_reads) == 1
+    assert isinstance(stored, np.memmap)
+    np.testing.assert_array_equal(stored, fresh)
+    assert np.nanmean(stored) == np.nanmean(fresh) == 2.
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from customFSS import fss_matrix
+
+# fss_matrix must match pysteps.verification.spatialscores.fss for every
+# threshold and scale (user-025), including the edges of the summed-area
+# tables: windows partly or fully outside the domain
+
+spatialscores = pytest.importorskip('pysteps.verification.spatialscores')
+
+# no pixels above the highest threshold: pysteps warns and returns NaN
+pytestmark = pytest.mark.filterwarnings('ignore:invalid value encountered')
+
+THRESHOLDS = [0.1, 1., 2.5, 5., 10., 1000.]
+SCALES = [1, 2, 3, 4, 7, 10, 25, 40, 61, 150]
+
+
+def get_fields(shape, seed):
+    rng = np.random.default_rng(seed)
+    X_f = rng.gamma(0.6, 3., shape)
+    X_o = rng.gamma(0.6, 3., shape)
+    X_f[rng.random(shape) < 0.05] = np.nan
+    X_o[rng.random(shape) < 0.05] = np.nan
+    X_o[:5, :] = np.nan
+    return X_f, X_o
+
+@pytest.mark.parametrize('shape, seed', [((45, 60), 0), ((37, 29), 1)])
+def test_fss_matrix_matches_pysteps(shape, seed):
+    X_f, X_o = get_fields(shape, seed)
+    scores = fss_matrix(X_f, X_o, THRESHOLDS, SCALES)
+    assert scores.shape == (len(THRESHOLDS), len(SCALES))
+    for idx_thr, thr in enumerate(THRESHOLDS):
+        for idx_scale, scale in enumerate(SCALES):
+            reference = spatialscores.fss(X_f, X_o, thr, scale)
+            np.testing.assert_allclose(
+                scores[idx_thr, idx_scale], reference, rtol=1e-12, atol=1e-14,
+                err_msg=f'threshold {thr}, scale {scale}'
+            )
+
+def test_fss_matrix_float32_fields():
+    # thresholds are compared in the dtype of the fields, as pysteps does
+    X_f, X_o = (values.astype(np.float32) for values in get_fields((40, 40), 2))
+    scores = fss_matrix(X_f, X_o, THRESHOLDS, SCALES)
+    for idx_thr, thr in enumerate(THRESHOLDS):
+        for idx_scale, scale in enumerate(SCALES):
+            np.testing.assert_allclose(
+                scores[idx_thr, idx_scale], spatialscores.fss(X_f, X_o, thr, scale),
+                rtol=1e-12, atol=1e-14
+            )
+
+def test_fss_matrix_does_not_modify_inputs():
+    X_f, X_o = get_fields((30, 30), 3)
+    references = (X_f.copy(), X_o.copy())
+    fss_matrix(X_f, X_o, THRESHOLDS, SCALES)
+    np.testing.assert_array_equal(X_f, references[0])
+    np.testing.assert_array_equal(X_o, references[1])
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pytest
+import xarray as xr
+from datetime import datetime, timedelta
+
+from LoadWriteData import build_dataset, write_time_stacked_dataset
+
+# the time steps of the per-init regrid files are appended to the file
+# written by the first batch, which is never rewritten (user-008)
+
+
+def get_steps(n_steps=10, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.gamma(0.5, 4., (n_steps, 30, 40)).astype(np.float32)
+    values[1, 3, 3] = np.nan
+    dates = [datetime(2022, 5, 3, 12) + timedelta(hours=hour) for hour in range(n_steps)]
+    lon, lat = np.meshgrid(np.linspace(-5., 2., 40), np.linspace(36., 42., 30))
+    return values, dates, lat, lon
+
+@pytest.mark.parametrize('profile', ['fast', 'default'])
+def test_time_steps_are_appended(tmp_path, monkeypatch, profile):
+    monkeypatch.chdir(tmp_path)
+    values, dates, lat, lon = get_steps()
+    filename = str(tmp_path / 'regrid_init.nc')
+    write_time_stacked_dataset(build_dataset(values[:4], dates[:4], lat, lon, 'pcp'), filename, profile)
+    inode = os.stat(filename).st_ino
+    write_time_stacked_dataset(build_dataset(values[4:], dates[4:], lat, lon, 'pcp'), filename, profile)
+    # dates already saved are kept
+    write_time_stacked_dataset(
+        build_dataset(values[:2] + 1., dates[:2], lat, lon, 'pcp'), filename, profile
+    )
+    assert os.stat(filename).st_ino == inode
+    with xr.open_dataset(filename) as ds:
+        assert ds.sizes['time'] == len(dates)
+        np.testing.assert_array_equal(ds['time'].values, np.array(dates, dtype='datetime64[ns]'))
+        np.testing.assert_array_equal(ds['pcp'].values, values)
+
+def test_packed_time_steps_are_appended(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    values, dates, lat, lon = get_steps()
+    # later steps within the range of the first batch
+    values[4:] = np.clip(values[4:], np.nanmin(values[:4]), np.nanmax(values[:4]))
+    filename = str(tmp_path / 'regrid_init.nc')
+    write_time_stacked_dataset(build_dataset(values[:4], dates[:4], lat, lon, 'pcp'), filename, 'archive')
+    with xr.open_dataset(filename) as ds:
+        saved = ds['pcp'].values
+        scale_factor = ds['pcp'].encoding['scale_factor']
+    inode = os.stat(filename).st_ino
+    write_time_stacked_dataset(build_dataset(values[4:], dates[4:], lat, lon, 'pcp'), filename, 'archive')
+    assert os.stat(filename).st_ino == inode
+    with xr.open_dataset(filename) as ds:
+        assert ds['pcp'].encoding['scale_factor'] == scale_factor
+        # the packed steps already saved are not quantised again
+        np.testing.assert_array_equal(ds['pcp'].values[:4], saved)
+        np.testing.assert_allclose(ds['pcp'].values, values, atol=scale_factor)
+
+def test_packed_values_out_of_range(tmp_path, monkeypatch):
+    # the file is rewritten with the range of all the time steps
+    monkeypatch.chdir(tmp_path)
+    values, dates, lat, lon = get_steps()
+    values[4:] *= 10.
+    filename = str(tmp_path / 'regrid_init.nc')
+    write_time_stacked_dataset(build_dataset(values[:4], dates[:4], lat, lon, 'pcp'), filename, 'archive')
+    write_time_stacked_dataset(build_dataset(values[4:], dates[4:], lat, lon, 'pcp'), filename, 'archive')
+    with xr.open_dataset(filename) as ds:
+        scale_factor = ds['pcp'].encoding['scale_factor']
+        np.testing.assert_allclose(ds['pcp'].values, values, atol=2 * scale_factor)
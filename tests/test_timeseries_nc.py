@@ -0,0 +1,45 @@
+import numpy as np
+from datetime import datetime, timedelta
+
+from LoadWriteData import build_dataset, write_dataset, TimeSeriesNC, nc_pool
+
+# the files of a TimeSeriesNC are only opened when their dates are requested,
+# and files holding a single date are never opened to be indexed (user-018)
+
+
+def get_dates(n_steps):
+    return [datetime(2022, 5, 3, 12) + timedelta(hours=hour) for hour in range(n_steps)]
+
+def write_file(filename, dates, seed=0):
+    lon, lat = np.meshgrid(np.linspace(-5., 2., 20), np.linspace(36., 42., 15))
+    values = np.random.default_rng(seed).random((len(dates), 15, 20)).astype(np.float32)
+    write_dataset(build_dataset(values, dates, lat, lon, 'pcp'), filename, 'fast')
+    return values
+
+def test_files_per_date_are_not_opened(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nc_pool.close_all()
+    dates = get_dates(4)
+    files = {date: str(tmp_path / f'regrid_{idx}.nc') for idx, date in enumerate(dates)}
+    values = write_file(files[dates[1]], [dates[1]])
+    series = TimeSeriesNC(files)
+    assert dates[1] in series
+    assert dates[0] not in series
+    assert len(nc_pool.datasets) == 0
+    np.testing.assert_array_equal(series.read_field('pcp', dates[1]).data, values[0])
+    nc_pool.close_all()
+
+def test_stacked_file_is_opened_on_first_access(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nc_pool.close_all()
+    dates = get_dates(6)
+    filename = str(tmp_path / 'regrid_init.nc')
+    # the last date is expected in the file but was not saved
+    values = write_file(filename, dates[:5])
+    series = TimeSeriesNC({date: filename for date in dates})
+    assert len(nc_pool.datasets) == 0
+    assert dates[3] in series
+    assert dates[5] not in series
+    assert list(nc_pool.datasets) == [filename]
+    np.testing.assert_array_equal(series.read_field('pcp', dates[3]).data, values[3])
+    nc_pool.close_all()